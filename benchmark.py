@@ -0,0 +1,429 @@
+import os
+import sys
+import json
+import time
+import copy
+import asyncio
+import argparse
+import tempfile
+import timeit
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import main as bot
+import mock_server
+import trace_report
+import stork_crypto
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+BENCH_ACCOUNT = {"username": "bench@example.com", "password": "benchmark"}
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+MICRO_SIZES = (10, 100, 1000, 10000)
+
+
+def peak_rss_mb() -> Optional[float]:
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def build_config(api_url: str, cognito_endpoint: str, workdir: str, args: argparse.Namespace) -> Dict:
+
+    config = copy.deepcopy(bot.DEFAULT_CONFIG)
+    config['api_url'] = api_url
+    config['cognito']['endpoint'] = cognito_endpoint
+    config['logging']['level'] = args.log_level
+    config['tracing'].update({'enabled': True, 'path': os.path.join(workdir, 'trace.jsonl')})
+    config['dispatch']['maxInFlight'] = args.max_in_flight
+    config['pipeline']['enabled'] = not args.phased
+    config['http']['conditionalRequests'] = not args.no_conditional
+    if args.record:
+        config['recording'].update({'enabled': True, 'path': args.record})
+    if args.rate is not None:
+        config['rateLimit'].update({'ratePerSecond': args.rate, 'burst': max(1, int(args.rate * 2)), 'maxRate': max(args.rate, config['rateLimit']['maxRate'])})
+    return config
+
+
+def isolate_state(workdir: str) -> None:
+
+    bot.token_store = bot.TokenStore(os.path.join(workdir, 'tokens.json'), os.path.join(workdir, 'tokens.journal'))
+    bot.validated_hashes = bot.ValidatedHashIndex(os.path.join(workdir, 'validated_hashes.jsonl'))
+    bot.PROXIES_PATH = os.path.join(workdir, 'proxies.txt')
+    bot.accounts = [dict(BENCH_ACCOUNT)]
+    bot.headless_mode = True
+    bot.token_managers.clear()
+    bot.stork_rate_limiter = None
+
+
+async def run_rounds(config: Dict, rounds: int) -> Dict:
+
+    token_manager = bot.get_token_manager(bot.accounts[0], config)
+    if not await token_manager.get_valid_token():
+        raise RuntimeError("无法从替身服务获取token")
+    if config['recording']['enabled']:
+        await bot.fetch_user_data(token_manager, config)
+
+    validations_before = sum(bot.VALIDATIONS_TOTAL.values.values())
+    round_durations: List[float] = []
+    failed = 0
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        bot.tracer.start_trace()
+        round_started = time.perf_counter()
+        with bot.tracer.span('round', account=1) as span:
+            success = await bot.process_account(0, config)
+            span.status = 'ok' if success else 'failed'
+        round_durations.append(time.perf_counter() - round_started)
+        failed += 0 if success else 1
+    elapsed = time.perf_counter() - started
+
+    validations = sum(bot.VALIDATIONS_TOTAL.values.values()) - validations_before
+    round_durations.sort()
+    return {
+        'rounds': rounds,
+        'failedRounds': failed,
+        'seconds': round(elapsed, 3),
+        'roundsPerSecond': round(rounds / elapsed, 3) if elapsed else 0.0,
+        'validations': validations,
+        'validationsPerSecond': round(validations / elapsed, 3) if elapsed else 0.0,
+        'roundP50': round(trace_report.percentile(round_durations, 0.50), 6),
+        'roundP95': round(trace_report.percentile(round_durations, 0.95), 6),
+        'roundP99': round(trace_report.percentile(round_durations, 0.99), 6)
+    }
+
+
+def vote_delays(spans: List[Dict]) -> Dict[str, List[float]]:
+
+    fetch_started: Dict[str, float] = {}
+    votes: Dict[str, List[float]] = {}
+    for span in spans:
+        if span.get('span') == 'get_signed_prices':
+            fetch_started[span.get('trace')] = span['start']
+        elif span.get('span') == 'send_validation':
+            votes.setdefault(span.get('trace'), []).append(span['start'] + span['duration'])
+
+    first, every = [], []
+    for trace, landed in votes.items():
+        if trace in fetch_started:
+            delays = [end - fetch_started[trace] for end in landed]
+            first.append(min(delays))
+            every.extend(delays)
+    return {'first': sorted(first), 'all': sorted(every)}
+
+
+async def run_e2e(args: argparse.Namespace) -> Dict:
+
+    workdir = tempfile.mkdtemp(prefix='stork-bench-')
+    server = None
+    if args.url:
+        api_url = args.url.rstrip('/')
+        cognito_endpoint = args.cognito_endpoint or f"{api_url}/cognito/"
+    else:
+        server = await mock_server.server_from_args(args).start()
+        api_url, cognito_endpoint = server.base_url, server.cognito_endpoint
+
+    config = build_config(api_url, cognito_endpoint, workdir, args)
+    if args.publisher_key:
+        publisher = stork_crypto.private_key_to_address(int(args.publisher_key, 16))
+        config['signatures'].update({'enabled': True, 'publishers': [publisher]})
+    bot.configure_logging(config)
+    isolate_state(workdir)
+    bot.tracer.configure(config)
+    bot.fixture_recorder.configure(config)
+    bot.signature_verifier.configure(config)
+    bot.response_cache.configure(config)
+    bot.validated_hashes.configure(config)
+    bot.user_stats_cache.configure(config)
+
+    try:
+        result = await run_rounds(config, args.rounds)
+    finally:
+        await bot.user_stats_cache.stop()
+        bot.signature_verifier.close()
+        await bot.close_http_session()
+        if server is not None:
+            await server.stop()
+        bot.tracer.close()
+
+    spans = trace_report.load_spans(config['tracing']['path'])
+    delays = vote_delays(spans)
+    result['stages'] = trace_report.summarize(spans)
+    result['firstVoteP50'] = round(trace_report.percentile(delays['first'], 0.50), 6)
+    result['voteLagP50'] = round(trace_report.percentile(delays['all'], 0.50), 6)
+    result['voteLagP95'] = round(trace_report.percentile(delays['all'], 0.95), 6)
+    result['peakRssMb'] = peak_rss_mb()
+    result['server'] = server.stats if server is not None else None
+    result['traceFile'] = config['tracing']['path']
+    return result
+
+
+def print_e2e(result: Dict) -> None:
+
+    print(f"轮数: {result['rounds']}（失败 {result['failedRounds']}），耗时 {result['seconds']:.2f}s")
+    print(f"吞吐: {result['roundsPerSecond']:.2f} 轮/秒，{result['validationsPerSecond']:.2f} 验证/秒（共 {result['validations']} 次）")
+    print(f"每轮耗时: p50 {result['roundP50'] * 1000:.1f}ms  p95 {result['roundP95'] * 1000:.1f}ms  p99 {result['roundP99'] * 1000:.1f}ms")
+    print(f"从开始获取价格到投票送达: 首个 p50 {result['firstVoteP50'] * 1000:.1f}ms  全部 p50 {result['voteLagP50'] * 1000:.1f}ms  p95 {result['voteLagP95'] * 1000:.1f}ms")
+    if result['peakRssMb'] is not None:
+        print(f"峰值RSS: {result['peakRssMb']:.1f} MB")
+    if result['server']:
+        print(f"替身服务请求统计: {json.dumps(result['server'], ensure_ascii=False)}")
+
+    print(f"{'阶段':<28}{'次数':>8}{'p50(ms)':>11}{'p95(ms)':>11}{'p99(ms)':>11}{'错误':>7}")
+    for key, row in sorted(result['stages'].items(), key=lambda item: -item[1]['p95']):
+        print(f"{key:<28}{row['count']:>8}{row['p50'] * 1000:>11.1f}{row['p95'] * 1000:>11.1f}{row['p99'] * 1000:>11.1f}{row['errors']:>7}")
+    print(f"追踪文件: {result['traceFile']}")
+
+
+async def run_replay(path: str, iterations: int, log_level: str, stream: bool = False) -> Dict:
+
+    config = copy.deepcopy(bot.DEFAULT_CONFIG)
+    config['logging']['level'] = log_level
+    bot.configure_logging(config)
+
+    fixtures = bot.load_fixtures(path)
+    if not fixtures.get('prices'):
+        raise RuntimeError(f"录制文件中没有价格响应: {path}")
+
+    stork_api = bot.ReplayStorkAPI(config, fixtures)
+    tokens = {"accessToken": "replay", "idToken": "replay"}
+    body_bytes = sum(len(body) for responses in fixtures.values() for _, _, body in responses)
+
+    assets = 0
+    user_stats = 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        if stream:
+            prices = bot.PriceBatch()
+            async for price in stork_api.stream_signed_prices(tokens):
+                prices.append(price)
+        else:
+            prices = await stork_api.get_signed_prices(tokens)
+        bot.validate_prices(prices)
+        assets += len(prices)
+    if fixtures.get('me'):
+        for _ in range(iterations):
+            await stork_api.get_user_stats(tokens)
+            user_stats += 1
+    elapsed = time.perf_counter() - started
+
+    replayed_bytes = sum(len(body) for _, _, body in fixtures['prices']) * iterations / len(fixtures['prices'])
+    return {
+        'fixtures': {endpoint: len(responses) for endpoint, responses in fixtures.items()},
+        'fixtureBytes': body_bytes,
+        'iterations': iterations,
+        'seconds': round(elapsed, 3),
+        'assets': assets,
+        'assetsPerSecond': round(assets / elapsed, 1) if elapsed else 0.0,
+        'priceMbPerSecond': round(replayed_bytes / elapsed / (1024 * 1024), 2) if elapsed else 0.0,
+        'userStatsCalls': user_stats,
+        'peakRssMb': peak_rss_mb()
+    }
+
+
+def print_replay(result: Dict) -> None:
+
+    print(f"录制响应: {json.dumps(result['fixtures'], ensure_ascii=False)}（共 {result['fixtureBytes'] / 1024:.1f} KB）")
+    print(f"回放 {result['iterations']} 次，耗时 {result['seconds']:.2f}s")
+    print(f"价格解析: {result['assetsPerSecond']:.0f} 资产/秒，{result['priceMbPerSecond']:.2f} MB/秒")
+    if result['userStatsCalls']:
+        print(f"用户统计解析: {result['userStatsCalls']} 次")
+    if result['peakRssMb'] is not None:
+        print(f"峰值RSS: {result['peakRssMb']:.1f} MB")
+
+
+def micro_cases(size: int) -> Dict[str, Callable[[], Any]]:
+
+    server = mock_server.StandInServer(assets=size)
+    snapshot = server.build_snapshot()['data']
+    parsed = bot.parse_signed_prices(snapshot)
+    by_asset = {item.asset: item for item in parsed}
+    id_token = mock_server.make_jwt({'sub': 'bench-user', 'email': BENCH_ACCOUNT['username'], 'custom:referral_code': 'BENCH', 'exp': int(time.time()) + 3600})
+    user_data = {
+        'username': BENCH_ACCOUNT['username'],
+        'userId': 'bench-user',
+        'referralCode': 'BENCH',
+        'stats': {'valid': size, 'invalid': 0, 'total': size, 'lastCheck': datetime.now().isoformat()}
+    }
+    config = copy.deepcopy(bot.DEFAULT_CONFIG)
+
+    return {
+        'parse_signed_prices': lambda: bot.parse_signed_prices(snapshot),
+        'validate_price': lambda: [bot.validate_price(item) for item in parsed],
+        'validate_prices': lambda: bot.validate_prices(parsed),
+        'extract_user_info_from_token': lambda: [bot.extract_user_info_from_token(id_token) for _ in range(size)],
+        'build_stats_frame': lambda: bot.build_stats_frame(user_data, f"📥 找到 {size} 个价格待验证", config, 0, 1, by_asset)
+    }
+
+
+def time_call(func: Callable[[], Any], repeat: int) -> float:
+
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def run_micro(sizes: List[int], repeat: int, log_level: str) -> Dict:
+
+    bot.configure_logging({'logging': {'level': log_level}})
+
+    results = {}
+    for size in sizes:
+        for name, func in micro_cases(size).items():
+            results[f"{name}[{size}]"] = time_call(func, repeat)
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'platform': sys.platform,
+        'results': results
+    }
+
+
+def load_results(path: str) -> Dict:
+
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_results(report: Dict, path: str) -> None:
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def compare_results(baseline: Dict, current: Dict, threshold: float) -> List[Dict]:
+
+    rows = []
+    for key, seconds in current['results'].items():
+        base = baseline['results'].get(key)
+        if not base:
+            continue
+        ratio = seconds / base
+        rows.append({'case': key, 'baseline': base, 'current': seconds, 'ratio': ratio, 'regressed': ratio > 1 + threshold})
+    return rows
+
+
+def print_micro(report: Dict) -> None:
+
+    print(f"Python {report['python']} ({report['platform']})")
+    print(f"{'用例':<40}{'每次调用(µs)':>16}")
+    for key, seconds in report['results'].items():
+        print(f"{key:<40}{seconds * 1e6:>16.1f}")
+
+
+def print_compare(rows: List[Dict], threshold: float) -> None:
+
+    print(f"{'用例':<40}{'基线(µs)':>14}{'当前(µs)':>14}{'变化':>10}")
+    for row in rows:
+        flag = '  ⚠ 变慢' if row['regressed'] else ''
+        print(f"{row['case']:<40}{row['baseline'] * 1e6:>14.1f}{row['current'] * 1e6:>14.1f}{(row['ratio'] - 1) * 100:>+9.1f}%{flag}")
+
+    regressions = sum(1 for row in rows if row['regressed'])
+    if regressions:
+        print(f"{regressions} 个用例变慢超过 {threshold * 100:.0f}%")
+    else:
+        print(f"没有用例变慢超过 {threshold * 100:.0f}%")
+
+
+def parse_args() -> argparse.Namespace:
+
+    parser = argparse.ArgumentParser(description="Stork 机器人性能基准测试")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    e2e = subparsers.add_parser('e2e', help="对本地替身服务跑完整的验证轮次")
+    e2e.add_argument('--rounds', type=int, default=20, help="验证轮数")
+    e2e.add_argument('--max-in-flight', type=int, default=8, help="并发提交数（dispatch.maxInFlight）")
+    e2e.add_argument('--phased', action='store_true', help="按旧的分阶段流程运行（先获取全部价格再提交），用于对比流水线")
+    e2e.add_argument('--no-conditional', action='store_true', help="关闭ETag/Last-Modified条件请求")
+    e2e.add_argument('--rate', type=float, default=None, help="覆盖rateLimit.ratePerSecond")
+    e2e.add_argument('--url', default=None, help="使用已运行的替身服务，而不是在进程内启动")
+    e2e.add_argument('--cognito-endpoint', default=None, help="配合--url使用的Cognito地址")
+    e2e.add_argument('--log-level', default='WARN', help="基准测试期间的日志级别")
+    e2e.add_argument('--record', default=None, help="把价格和用户统计响应录制到该文件，供replay使用")
+    e2e.add_argument('--json', action='store_true', help="以JSON输出")
+    mock_server.add_server_arguments(e2e)
+
+    replay = subparsers.add_parser('replay', help="离线回放录制的响应，测量解析吞吐")
+    replay.add_argument('path', nargs='?', default=bot.FIXTURES_PATH, help="录制文件路径")
+    replay.add_argument('--iterations', type=int, default=100, help="回放次数")
+    replay.add_argument('--stream', action='store_true', help="使用流式解析（与流水线相同的代码路径）")
+    replay.add_argument('--log-level', default='WARN', help="基准测试期间的日志级别")
+    replay.add_argument('--json', action='store_true', help="以JSON输出")
+
+    micro = subparsers.add_parser('micro', help="对解析、校验和界面渲染等热点函数做微基准测试")
+    compare = subparsers.add_parser('compare', help="与基线对比，标记变慢的用例")
+    for sub in (micro, compare):
+        sub.add_argument('--sizes', type=int, nargs='+', default=list(MICRO_SIZES), help="合成数据的资产数量")
+        sub.add_argument('--repeat', type=int, default=5, help="每个用例重复次数，取最快一次")
+        sub.add_argument('--log-level', default='WARN', help="基准测试期间的日志级别")
+        sub.add_argument('--json', action='store_true', help="以JSON输出")
+    micro.add_argument('--save', nargs='?', const=BASELINE_PATH, default=None, help="保存为基线文件（默认benchmark_baseline.json）")
+    compare.add_argument('--baseline', default=BASELINE_PATH, help="基线文件路径")
+    compare.add_argument('--current', default=None, help="与已保存的结果文件对比，而不是重新运行")
+    compare.add_argument('--threshold', type=float, default=0.10, help="变慢超过该比例即视为回归")
+
+    return parser.parse_args()
+
+
+def main() -> int:
+
+    args = parse_args()
+
+    if args.command == 'e2e':
+        result = asyncio.run(run_e2e(args))
+        if args.json:
+            print(json.dumps(result, indent=2, ensure_ascii=False))
+        else:
+            print_e2e(result)
+        return 1 if result['failedRounds'] else 0
+
+    if args.command == 'replay':
+        if not os.path.exists(args.path):
+            print(f"没有找到录制文件: {args.path}，请在config.json中开启recording或运行 python benchmark.py e2e --record", file=sys.stderr)
+            return 2
+        result = asyncio.run(run_replay(args.path, args.iterations, args.log_level, args.stream))
+        if args.json:
+            print(json.dumps(result, indent=2, ensure_ascii=False))
+        else:
+            print_replay(result)
+        return 0
+
+    if args.command == 'micro':
+        report = run_micro(args.sizes, args.repeat, args.log_level)
+        if args.save:
+            save_results(report, args.save)
+        if args.json:
+            print(json.dumps(report, indent=2, ensure_ascii=False))
+        else:
+            print_micro(report)
+            if args.save:
+                print(f"基线已保存到 {args.save}")
+        return 0
+
+    if args.command == 'compare':
+        if not os.path.exists(args.baseline):
+            print(f"没有找到基线文件: {args.baseline}，请先运行 python benchmark.py micro --save", file=sys.stderr)
+            return 2
+        baseline = load_results(args.baseline)
+        current = load_results(args.current) if args.current else run_micro(args.sizes, args.repeat, args.log_level)
+        rows = compare_results(baseline, current, args.threshold)
+        if args.json:
+            print(json.dumps(rows, indent=2, ensure_ascii=False))
+        else:
+            print_compare(rows, args.threshold)
+        return 1 if any(row['regressed'] for row in rows) else 0
+
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,52 +1,123 @@
 import os
 import sys
+import argparse
+import array
 import json
 import time
 import random
+import re
 import asyncio
+import email.utils
 import logging
 import logging.handlers  
-import requests
+import atexit
+import contextvars
+import queue
 import traceback
 import threading
 import urllib.parse
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional, Tuple, Union
+from typing import Dict, Iterable, List, Any, Optional, Set, Tuple, Union
 from colorama import init, Fore, Back, Style
 import base64
+import codecs
+import concurrent.futures
+import bisect
+import gzip
+import hashlib
+import hmac
+import mmap
+import struct
 import aiohttp
-from pycognito import Cognito  
+from aiohttp import web
+import stork_crypto
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 
 init(autoreset=True)
 
 
 start_time = time.time()
+process_start_time = start_time
 current_config = {}
 user_data = {}
 validation_status = ""
 price_data = {}
 accounts = []
-last_display_lines = 0
 
 
 logger = logging.getLogger("stork_bot")
 logger.setLevel(logging.INFO)
 
 
+API_LEVEL = 15
+logging.addLevelName(API_LEVEL, "API")
+LOG_LEVELS = {
+    "DEBUG": logging.DEBUG,
+    "API": API_LEVEL,
+    "INFO": logging.INFO,
+    "SUCCESS": logging.INFO,
+    "WARN": logging.WARNING,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+    "CRITICAL": logging.CRITICAL
+}
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        
+        if not isinstance(record.args, tuple) or not any(isinstance(arg, LazyValue) for arg in record.args):
+            return super().prepare(record)
+        record.args = tuple(
+            arg if arg is None or isinstance(arg, (LazyValue, str, int, float)) else str(arg)
+            for arg in record.args
+        )
+        return record
+
+
 log_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stork_bot.log")
-file_handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=50*1024*1024, backupCount=3)
+file_handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=50*1024*1024, backupCount=3, encoding='utf-8')
 formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 file_handler.setFormatter(formatter)
 
 
-logger.addHandler(file_handler)
+log_queue: queue.SimpleQueue = queue.SimpleQueue()
+log_listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+
+logger.addHandler(DeferredQueueHandler(log_queue))
 logger.propagate = False  
 
 
 CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json')
 TOKENS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tokens.json')
+TOKENS_JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tokens.journal')
 PROXIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'proxies.txt')
+TRACE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stork_trace.jsonl')
+VALIDATED_HASHES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'validated_hashes.jsonl')
+PRICE_HISTORY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'price_history.bin')
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stork_fixtures.jsonl.gz')
+
+
+PRICE_FRESHNESS_SECONDS = 300
+DISPLAY_ASSETS = ('BTCUSD',)
+STREAM_CHUNK_SIZE = 64 * 1024
+HTTP_ACCEPT_ENCODING = 'gzip, deflate, br' if brotli is not None else 'gzip, deflate'
 
 
 DEFAULT_CONFIG = {
@@ -58,8 +129,101 @@ DEFAULT_CONFIG = {
     "stork": {
         "intervalSeconds": 300 
     },
+    "userStats": {
+        "enabled": True,
+        "ttlSeconds": 300
+    },
+    "polling": {
+        "adaptive": False,
+        "minSeconds": 30,
+        "maxSeconds": 600,
+        "smoothing": 0.3,
+        "probeFactor": 0.9,
+        "quantile": 0.5,
+        "guardSeconds": 2
+    },
     "threads": {
         "maxWorkers": 1
+    },
+    "logging": {
+        "level": "INFO"
+    },
+    "tracing": {
+        "enabled": False,
+        "maxBytes": 20971520,
+        "backupCount": 5
+    },
+    "history": {
+        "enabled": False,
+        "rule": "mad",
+        "capacity": 64,
+        "maxAssets": 2048,
+        "minSamples": 8,
+        "maxDeviation": 10.0,
+        "minRelativeTolerance": 0.001
+    },
+    "signatures": {
+        "enabled": False,
+        "publishers": [],
+        "ethSignedMessage": True,
+        "timestampUnit": "seconds",
+        "workers": 2,
+        "cacheSize": 50000
+    },
+    "recording": {
+        "enabled": False,
+        "endpoints": ["prices", "me"]
+    },
+    "metrics": {
+        "enabled": False,
+        "host": "127.0.0.1",
+        "port": 9108,
+        "lagIntervalSeconds": 1
+    },
+    "display": {
+        "mode": "auto",
+        "statusFile": "",
+        "maxFps": 2,
+        "countdownRefreshSeconds": 5
+    },
+    "dispatch": {
+        "maxInFlight": 8,
+        "deadlineMarginSeconds": 0.25
+    },
+    "pipeline": {
+        "enabled": True,
+        "queueSize": 256,
+        "judgeBatchSize": 64
+    },
+    "rateLimit": {
+        "ratePerSecond": 5,
+        "burst": 10,
+        "minRate": 0.5,
+        "maxRate": 50,
+        "increasePerSecond": 0.5,
+        "decreaseFactor": 0.5
+    },
+    "auth": {
+        "refreshMarginSeconds": 300,
+        "outcomeTtlSeconds": {
+            "success": 30,
+            "throttled": 120,
+            "failed": 30
+        }
+    },
+    "http": {
+        "poolSize": 20,
+        "poolSizePerHost": 10,
+        "keepaliveSeconds": 60,
+        "dnsCacheSeconds": 300,
+        "conditionalRequests": True,
+        "conditionalCacheEntries": 256,
+        "timeouts": {
+            "prices": 30,
+            "validations": 15,
+            "me": 30,
+            "cognito": 15
+        }
     }
 }
 
@@ -67,6 +231,9 @@ DEFAULT_CONFIG = {
 previous_stats = {"validCount": 0, "invalidCount": 0}
 
 
+http_session: Optional[aiohttp.ClientSession] = None
+
+
 try:
     from accounts import accounts
 except ImportError:
@@ -84,33 +251,251 @@ accounts = [
 """)
     accounts = []
 
-def log(message: str, level: str = "INFO") -> None:
+class LazyValue:
+    
+    
+    __slots__ = ('factory',)
+    
+    def __init__(self, factory):
+        self.factory = factory
+    
+    def __str__(self) -> str:
+        
+        return str(self.factory())
+
+
+def log(message: str, level: str = "INFO", *args) -> None:
    
+    levelno = LOG_LEVELS.get(level, logging.INFO)
+    if logger.isEnabledFor(levelno):
+        logger.log(levelno, message, *args)
+
+
+def configure_logging(config: Dict) -> None:
+    
+    level = config.get('logging', {}).get('level', 'INFO').upper()
+    logger.setLevel(LOG_LEVELS.get(level, logging.INFO))
+
+
+class Span:
+    
+    
+    __slots__ = ('name', 'attrs', 'start', 'started', 'status', 'retries')
+    
+    def __init__(self, name: str, attrs: Dict):
+        self.name = name
+        self.attrs = attrs
+        self.status = 'ok'
+        self.retries = 0
+    
+    def __enter__(self) -> 'Span':
+        
+        self.start = time.time()
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb) -> None:
+        
+        if exc_type is not None and self.status == 'ok':
+            self.status = 'cancelled' if issubclass(exc_type, asyncio.CancelledError) else 'error'
+        tracer.emit(self, time.perf_counter() - self.started)
+
+
+class NullSpan:
+    
+    
+    status = 'ok'
+    retries = 0
+    
+    @property
+    def attrs(self) -> Dict:
+        
+        return {}
+    
+    def __enter__(self) -> 'NullSpan':
+        
+        return self
+    
+    def __exit__(self, exc_type, exc, tb) -> None:
+        
+        pass
+    
+    def __setattr__(self, name: str, value: Any) -> None:
+        
+        pass
+
+
+class Tracer:
+    
+    
+    def __init__(self):
+        self.enabled = False
+        self.trace_id: contextvars.ContextVar = contextvars.ContextVar('trace_id', default='')
+        self.null_span = NullSpan()
+        self.logger = logging.getLogger("stork_bot.trace")
+        self.logger.propagate = False
+        self.listener: Optional[logging.handlers.QueueListener] = None
+    
+    def configure(self, config: Dict) -> None:
+        
+        trace_config = config.get('tracing', {})
+        if not trace_config.get('enabled', False) or self.enabled:
+            return
+        
+        trace_path = trace_config.get('path', TRACE_PATH)
+        handler = logging.handlers.RotatingFileHandler(
+            trace_path,
+            maxBytes=trace_config.get('maxBytes', 20*1024*1024),
+            backupCount=trace_config.get('backupCount', 5),
+            encoding='utf-8'
+        )
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        
+        trace_queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.listener = logging.handlers.QueueListener(trace_queue, handler)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+        
+        self.logger.addHandler(DeferredQueueHandler(trace_queue))
+        self.logger.setLevel(logging.INFO)
+        self.enabled = True
+        log("追踪已开启，写入 %s", "INFO", trace_path)
+    
+    def span(self, name: str, **attrs) -> Union[Span, NullSpan]:
+        
+        if not self.enabled:
+            return self.null_span
+        return Span(name, attrs)
+    
+    def start_trace(self) -> None:
+        
+        if self.enabled:
+            self.trace_id.set(os.urandom(8).hex())
+    
+    def emit(self, span: Span, duration: float) -> None:
+        
+        record = {
+            'trace': self.trace_id.get(),
+            'span': span.name,
+            'start': round(span.start, 6),
+            'duration': round(duration, 6),
+            'status': span.status,
+            'retries': span.retries
+        }
+        record.update(span.attrs)
+        self.logger.info('%s', LazyValue(lambda: json.dumps(record, ensure_ascii=False)))
+
+    def close(self) -> None:
+
+        if self.listener is not None:
+            self.listener.stop()
+            atexit.unregister(self.listener.stop)
+            for handler in self.listener.handlers:
+                handler.close()
+            self.listener = None
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+        self.enabled = False
+
+
+tracer = Tracer()
+
+
+FIXTURE_REDACTED_FIELDS = {
+    'id', 'sub', 'email', 'username', 'password', 'referral_code', 'referralCode',
+    'accessToken', 'idToken', 'refreshToken', 'AccessToken', 'IdToken', 'RefreshToken'
+}
+FIXTURE_RECORDED_HEADERS = ('Content-Type', 'Date', 'ETag', 'Last-Modified', 'Cache-Control', 'Retry-After')
+
+
+def redact_fixture_value(value: Any) -> Any:
+    
+    if isinstance(value, dict):
+        return {key: '[REDACTED]' if key in FIXTURE_REDACTED_FIELDS and item else redact_fixture_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [redact_fixture_value(item) for item in value]
+    if isinstance(value, str) and value.startswith('eyJ') and value.count('.') == 2:
+        return '[REDACTED]'
+    return value
+
+
+def redact_fixture_body(body: bytes) -> bytes:
+    
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return body
+    
+    redacted = redact_fixture_value(data)
+    if redacted == data:
+        return body
+    return json.dumps(redacted, ensure_ascii=False).encode('utf-8')
+
+
+class FixtureRecorder:
     
-    clean_message = ''.join(c for c in message if ord(c) < 127)
     
-    if level.upper() == "DEBUG":
-        logger.debug(clean_message)
-    elif level.upper() == "INFO":
-        logger.info(clean_message)
-    elif level.upper() == "WARN" or level.upper() == "WARNING":
-        logger.warning(clean_message)
-    elif level.upper() == "ERROR":
-        logger.error(clean_message)
-    elif level.upper() == "CRITICAL":
-        logger.critical(clean_message)
-    elif level.upper() == "API" or level.upper() == "SUCCESS":
-        logger.info(clean_message)
+    def __init__(self):
+        self.enabled = False
+        self.path = FIXTURES_PATH
+        self.endpoints: Set[str] = set()
     
+    def configure(self, config: Dict) -> None:
+        
+        recording = config.get('recording', {})
+        if not recording.get('enabled', False):
+            return
+        
+        self.path = recording.get('path', FIXTURES_PATH)
+        self.endpoints = set(recording.get('endpoints', ['prices', 'me']))
+        self.enabled = True
+        log("响应录制已开启，写入 %s", "INFO", self.path)
     
+    def record(self, endpoint: str, method: str, path: str, status: int, headers: Any, body: bytes) -> None:
+        
+        if not self.enabled or endpoint not in self.endpoints:
+            return
+        
+        entry = {
+            'endpoint': endpoint,
+            'method': method,
+            'path': path,
+            'status': status,
+            'headers': {name: headers[name] for name in FIXTURE_RECORDED_HEADERS if name in headers},
+            'body': base64.b64encode(redact_fixture_body(body)).decode('ascii'),
+            'recordedAt': time.time()
+        }
+        try:
+            with gzip.open(self.path, 'ab') as f:
+                f.write(json.dumps(entry).encode('utf-8') + b'\n')
+        except OSError as e:
+            log("写入录制文件失败: %s", "ERROR", str(e))
+
+
+fixture_recorder = FixtureRecorder()
+
+
+def load_fixtures(path: str) -> Dict[str, List[Tuple[int, Dict, bytes]]]:
     
+    fixtures: Dict[str, List[Tuple[int, Dict, bytes]]] = {}
+    with gzip.open(path, 'rb') as f:
+        try:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                fixtures.setdefault(entry['endpoint'], []).append((entry['status'], entry.get('headers', {}), base64.b64decode(entry['body'])))
+        except (EOFError, gzip.BadGzipFile):
+            log("录制文件 %s 末尾不完整，已忽略", "WARN", path)
+    return fixtures
 
 
 def load_config() -> Dict:
    
     try:
         if not os.path.exists(CONFIG_PATH):
-            log(f"Config file not found at {CONFIG_PATH}, using default configuration", "WARN")
+            log("Config file not found at %s, using default configuration", "WARN", CONFIG_PATH)
             os.makedirs(os.path.dirname(CONFIG_PATH), exist_ok=True)
             with open(CONFIG_PATH, 'w') as f:
                 json.dump(DEFAULT_CONFIG, f, indent=2)
@@ -123,7 +508,7 @@ def load_config() -> Dict:
         log('Accounts loaded successfully from accounts.py')
         return user_config
     except Exception as e:
-        log(f"Error loading config: {str(e)}", "ERROR")
+        log("Error loading config: %s", "ERROR", str(e))
         return DEFAULT_CONFIG
 
 
@@ -144,7 +529,7 @@ def load_proxies() -> List[str]:
    
     try:
         if not os.path.exists(PROXIES_PATH):
-            log(f"Proxy file not found at {PROXIES_PATH}, creating empty file", "WARN")
+            log("Proxy file not found at %s, creating empty file", "WARN", PROXIES_PATH)
             with open(PROXIES_PATH, 'w') as f:
                 pass
             return []
@@ -155,169 +540,685 @@ def load_proxies() -> List[str]:
         
         random.shuffle(proxies)
         
-        log(f"Loaded {len(proxies)} proxies from {PROXIES_PATH}")
+        log("Loaded %s proxies from %s", "INFO", len(proxies), PROXIES_PATH)
         if proxies:
-            log(f"Trying to run with {proxies[0]}")
+            log("Trying to run with %s", "INFO", proxies[0])
         return proxies
     except Exception as e:
-        log(f"Error loading proxies: {str(e)}", "ERROR")
+        log("Error loading proxies: %s", "ERROR", str(e))
         return []
 
 
-def save_tokens(tokens: Dict, username: str) -> bool:
-   
-    try:
-        log(f"开始保存用户 {username} 的tokens...", "INFO")
-        
-        
-        all_tokens = {}
-        if os.path.exists(TOKENS_PATH):
-            try:
-                with open(TOKENS_PATH, 'r') as f:
-                    file_content = f.read().strip()
-                    if file_content:  
-                        all_tokens = json.loads(file_content)
-                        log(f"成功读取现有的tokens文件，包含 {len(all_tokens)} 个账户", "INFO")
-                    else:
-                        log("tokens.json文件为空，将创建新文件", "WARN")
-            except json.JSONDecodeError as e:
-                log(f"tokens.json文件损坏: {str(e)}，将重新创建", "WARN")
-            except Exception as e:
-                log(f"读取tokens.json时出错: {str(e)}，将重新创建", "WARN")
-        else:
-            log("tokens.json文件不存在，将创建新文件", "INFO")
-        
+def get_http_session(config: Dict) -> aiohttp.ClientSession:
+
+    global http_session
+
+    if http_session is None or http_session.closed:
+        http_config = config.get('http', {})
+        connector = aiohttp.TCPConnector(
+            limit=http_config.get('poolSize', 20),
+            limit_per_host=http_config.get('poolSizePerHost', 10),
+            ttl_dns_cache=http_config.get('dnsCacheSeconds', 300),
+            keepalive_timeout=http_config.get('keepaliveSeconds', 60)
+        )
+        http_session = aiohttp.ClientSession(connector=connector)
+        log("已创建共享HTTP连接池", "INFO")
+
+    return http_session
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def get_http_timeout(config: Dict, endpoint: str, deadline: Optional[float] = None, streamed: bool = False) -> aiohttp.ClientTimeout:
+
+    timeouts = config.get('http', {}).get('timeouts', {})
+    total = timeouts.get(endpoint, 30)
+    if streamed:
+        return aiohttp.ClientTimeout(total=None, sock_connect=total, sock_read=total)
+    if deadline is not None:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"{endpoint} 请求已超过截止时间 {-remaining:.2f}s")
+        total = min(total, remaining) if total else remaining
+    return aiohttp.ClientTimeout(total=total)
+
+
+class NotModified(Exception):
+    pass
+
+
+class CachedResponse:
+    
+    
+    __slots__ = ('etag', 'last_modified', 'value', 'pending')
+    
+    def __init__(self):
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self.value: Any = None
+        self.pending: Optional[Tuple[Optional[str], Optional[str]]] = None
+
+
+class ResponseCache:
+    
+    
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.entries: OrderedDict = OrderedDict()
+        self.enabled = True
+    
+    def configure(self, config: Dict) -> None:
         
-        if 'expiresIn' in tokens and 'expiresAt' not in tokens:
-            tokens['expiresAt'] = int(time.time() * 1000) + tokens['expiresIn']
-            log(f"为用户 {username} 添加了expiresAt时间戳: {tokens['expiresAt']}", "INFO")
+        http_config = config.get('http', {})
+        self.enabled = http_config.get('conditionalRequests', True)
+        self.max_entries = max(1, http_config.get('conditionalCacheEntries', 256))
+        self.entries.clear()
+    
+    def request_headers(self, key: Tuple[str, str]) -> Dict:
+        
+        entry = self.entries.get(key) if self.enabled else None
+        if entry is None or entry.value is None:
+            return {}
+        headers = {}
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        return headers
+    
+    def remember(self, key: Tuple[str, str], headers: Any) -> None:
         
+        if not self.enabled:
+            return
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        entry = self.entries.get(key)
+        if entry is None:
+            if not etag and not last_modified:
+                return
+            entry = self.entries[key] = CachedResponse()
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        entry.pending = (etag, last_modified)
+    
+    def commit(self, key: Tuple[str, str], value: Any) -> None:
         
-        required_fields = ['accessToken', 'idToken', 'refreshToken']
-        missing_fields = [field for field in required_fields if field not in tokens or not tokens[field]]
+        entry = self.entries.get(key)
+        if entry is None or entry.pending is None:
+            return
+        entry.etag, entry.last_modified = entry.pending
+        entry.pending = None
+        entry.value = value if entry.etag or entry.last_modified else None
+        self.entries.move_to_end(key)
+    
+    def cached(self, key: Tuple[str, str]) -> Any:
         
-        if missing_fields:
-            log(f"警告: 用户 {username} 的tokens缺少以下字段: {', '.join(missing_fields)}", "WARN")
+        entry = self.entries.get(key)
+        if entry is None or entry.value is None:
+            raise Exception(f"{key[0]} 返回304但没有可复用的缓存")
+        self.entries.move_to_end(key)
+        return entry.value
+    
+    def invalidate(self, key: Tuple[str, str]) -> None:
         
+        self.entries.pop(key, None)
+
+
+response_cache = ResponseCache()
+
+
+async def close_http_session() -> None:
+
+    global http_session
+
+    if http_session is not None and not http_session.closed:
+        await http_session.close()
+    http_session = None
+
+
+class Metric:
+    
+    
+    def __init__(self, name: str, help_text: str, metric_type: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.metric_type = metric_type
+        self.label_names = label_names
+        self.values: Dict[Tuple[str, ...], Any] = {}
+    
+    def _format_labels(self, label_values: Tuple[str, ...], extra: str = '') -> str:
         
-        all_tokens[username] = tokens
-        log(f"已将用户 {username} 的tokens添加到内存中", "INFO")
+        pairs = [f'{name}="{value}"' for name, value in zip(self.label_names, label_values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+    
+    def render(self) -> List[str]:
         
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        for label_values, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{self._format_labels(label_values)} {value}")
+        return lines
+
+
+class Counter(Metric):
+    
+    
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, 'counter', label_names)
+    
+    def inc(self, *label_values: str, amount: float = 1) -> None:
         
-        with open(TOKENS_PATH, 'w') as f:
-            json.dump(all_tokens, f, indent=2)
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+
+class Gauge(Metric):
+    
+    
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, 'gauge', label_names)
+    
+    def set(self, value: float, *label_values: str) -> None:
         
+        self.values[label_values] = value
+
+
+class Histogram(Metric):
+    
+    
+    DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+    
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, 'histogram', label_names)
+        self.buckets = buckets
+    
+    def observe(self, value: float, *label_values: str) -> None:
         
-        if os.path.exists(TOKENS_PATH):
-            file_size = os.path.getsize(TOKENS_PATH)
-            if file_size > 0:
-                log(f"成功保存用户 {username} 的tokens到文件，文件大小: {file_size} 字节", "SUCCESS")
-                
-                
-                try:
-                    with open(TOKENS_PATH, 'r') as f:
-                        saved_tokens = json.load(f)
-                    if username in saved_tokens:
-                        log(f"验证成功: 用户 {username} 的tokens已正确保存", "SUCCESS")
-                    else:
-                        log(f"验证失败: 文件中未找到用户 {username} 的tokens", "ERROR")
-                        return False
-                except Exception as e:
-                    log(f"验证tokens文件时出错: {str(e)}", "ERROR")
-                    return False
-            else:
-                log(f"保存失败: tokens.json文件大小为0", "ERROR")
-                return False
-        else:
-            log(f"保存失败: tokens.json文件不存在", "ERROR")
-            return False
+        series = self.values.get(label_values)
+        if series is None:
+            series = self.values[label_values] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
         
-        return True
-    except Exception as e:
-        log(f"保存tokens错误: {str(e)}", "ERROR")
-        return False
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series['counts'][index] += 1
+        series['sum'] += value
+        series['count'] += 1
+    
+    def render(self) -> List[str]:
+        
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        for label_values, series in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series['counts']):
+                cumulative += count
+                bucket_labels = self._format_labels(label_values, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            bucket_labels = self._format_labels(label_values, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {series['count']}")
+            lines.append(f"{self.name}_sum{self._format_labels(label_values)} {series['sum']}")
+            lines.append(f"{self.name}_count{self._format_labels(label_values)} {series['count']}")
+        return lines
 
 
-def validate_tokens(tokens: Dict) -> bool:
+class MetricsRegistry:
     
-    required_fields = ['accessToken', 'idToken', 'refreshToken']
     
-    if not isinstance(tokens, dict):
-        return False
+    def __init__(self):
+        self.metrics: List[Metric] = []
+    
+    def register(self, metric: Metric) -> Metric:
         
-    for field in required_fields:
-        if field not in tokens or not tokens[field]:
-            return False
+        self.metrics.append(metric)
+        return metric
     
+    def render(self) -> str:
+        
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+metrics_registry = MetricsRegistry()
+HTTP_REQUEST_DURATION = metrics_registry.register(Histogram('stork_http_request_duration_seconds', 'HTTP request latency by endpoint', ('endpoint',)))
+HTTP_RESPONSES = metrics_registry.register(Counter('stork_http_responses_total', 'HTTP responses by endpoint and status class', ('endpoint', 'status')))
+VALIDATIONS_TOTAL = metrics_registry.register(Counter('stork_validations_total', 'Validation submissions by result', ('result',)))
+TOKEN_REFRESHES_TOTAL = metrics_registry.register(Counter('stork_token_refreshes_total', 'Token refresh attempts by outcome', ('outcome',)))
+ROUND_DURATION = metrics_registry.register(Histogram('stork_round_duration_seconds', 'Duration of a full validation round', (), (1, 5, 10, 30, 60, 120, 300, 600)))
+SIGNATURE_CHECKS_TOTAL = metrics_registry.register(Counter('stork_signature_checks_total', 'Price signature checks by result', ('result',)))
+EVENT_LOOP_LAG = metrics_registry.register(Gauge('stork_event_loop_lag_seconds', 'Event loop scheduling lag'))
+
+
+def record_http_response(endpoint: str, status: int, duration: float) -> None:
     
-    if 'expiresIn' not in tokens and 'expiresAt' not in tokens:
-        return False
-            
-    return True
+    HTTP_REQUEST_DURATION.observe(duration, endpoint)
+    if status == 429:
+        status_class = '429'
+    else:
+        status_class = f"{status // 100}xx" if status else 'error'
+    HTTP_RESPONSES.inc(endpoint, status_class)
+
+
+async def monitor_event_loop_lag(interval: float) -> None:
+    
+    while True:
+        started = time.monotonic()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.set(max(0.0, time.monotonic() - started - interval))
 
 
-def get_tokens(username: str = None) -> Dict:
+async def start_metrics_server(config: Dict) -> Optional[Tuple[web.AppRunner, asyncio.Task]]:
+    
+    metrics_config = config.get('metrics', {})
+    if not metrics_config.get('enabled', False):
+        return None
+    
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(text=metrics_registry.render(), content_type='text/plain', charset='utf-8')
     
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    
+    host = metrics_config.get('host', '127.0.0.1')
+    port = metrics_config.get('port', 9108)
     try:
-        log(f"尝试读取{'用户 ' + username if username else '所有用户'}的tokens...", "INFO")
-        
-        if not os.path.exists(TOKENS_PATH):
-            log(f"Tokens文件不存在: {TOKENS_PATH}", "ERROR")
-            raise FileNotFoundError(f"Tokens文件不存在: {TOKENS_PATH}")
-        
-        
-        if os.path.getsize(TOKENS_PATH) == 0:
-            log("Tokens文件为空", "ERROR")
-            raise ValueError("tokens.json为空")
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        log("指标服务启动失败: %s", "ERROR", str(e))
+        await runner.cleanup()
+        return None
+    log("指标服务已启动: http://%s:%s/metrics", "INFO", host, port)
+    
+    lag_task = asyncio.create_task(monitor_event_loop_lag(metrics_config.get('lagIntervalSeconds', 1)))
+    return runner, lag_task
+
+
+async def stop_metrics_server(server: Optional[Tuple[web.AppRunner, asyncio.Task]]) -> None:
+    
+    if server is None:
+        return
+    runner, lag_task = server
+    lag_task.cancel()
+    await runner.cleanup()
+
+
+class TokenStore:
+    
+    
+    def __init__(self, snapshot_path: str, journal_path: str, flush_delay: float = 1.0, compact_threshold: int = 200):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.flush_delay = flush_delay
+        self.compact_threshold = compact_threshold
+        self.tokens: Dict[str, Dict] = {}
+        self.pending: Dict[str, Dict] = {}
+        self.journal_entries = 0
+        self.loaded = False
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+        self.lock = threading.Lock()
+    
+    def load(self) -> Dict[str, Dict]:
         
-        try:
-            with open(TOKENS_PATH, 'r') as f:
-                file_content = f.read().strip()
-                if not file_content:
-                    log("Tokens文件内容为空", "ERROR")
-                    raise ValueError("tokens.json内容为空")
-                all_tokens = json.loads(file_content)
-        except json.JSONDecodeError as e:
-            log(f"Tokens文件格式错误: {str(e)}", "ERROR")
-            raise ValueError(f"Tokens文件格式错误: {str(e)}")
-        
-        log(f"成功读取tokens文件，包含 {len(all_tokens)} 个账户", "INFO")
-        
-        
-        if username:
-            if username not in all_tokens:
-                log(f"未找到用户 {username} 的tokens", "ERROR")
-                raise ValueError(f"未找到用户 {username} 的tokens")
-            tokens = all_tokens[username]
-            log(f"成功获取用户 {username} 的tokens", "SUCCESS")
-        else:
+        with self.lock:
+            if self.loaded:
+                return self.tokens
+            
+            try:
+                if os.path.exists(self.snapshot_path):
+                    with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                        file_content = f.read().strip()
+                    if file_content:
+                        self.tokens = json.loads(file_content)
+            except json.JSONDecodeError as e:
+                log("tokens.json文件损坏: %s，仅使用日志恢复", "WARN", str(e))
+            except Exception as e:
+                log("读取tokens.json时出错: %s", "WARN", str(e))
+            
+            if os.path.exists(self.journal_path):
+                valid_size = 0
+                with open(self.journal_path, 'rb') as f:
+                    for line in f:
+                        try:
+                            if not line.endswith(b'\n'):
+                                raise ValueError("incomplete record")
+                            entry = json.loads(line)
+                            self.tokens[entry['username']] = entry['tokens']
+                            self.journal_entries += 1
+                            valid_size += len(line)
+                        except (ValueError, KeyError, TypeError):
+                            log("丢弃tokens日志中不完整的记录", "WARN")
+                            break
+                
+                if valid_size < os.path.getsize(self.journal_path):
+                    with open(self.journal_path, 'r+b') as f:
+                        f.truncate(valid_size)
             
-            if not all_tokens:
-                log("tokens.json为空", "ERROR")
-                raise ValueError("tokens.json为空")
-            first_username = next(iter(all_tokens.keys()))
-            tokens = all_tokens[first_username]
-            log(f"未指定用户名，返回第一个用户 {first_username} 的tokens", "INFO")
+            self.loaded = True
+            log("Token存储已加载，包含 %s 个账户", "INFO", len(self.tokens))
+            return self.tokens
+    
+    def get(self, username: str) -> Optional[Dict]:
         
+        return self.load().get(username)
+    
+    def put(self, username: str, tokens: Dict) -> None:
         
-        if not validate_tokens(tokens):
-            log(f"用户 {username or first_username} 的tokens格式无效", "ERROR")
-            raise ValueError("无效的tokens格式")
+        self.load()
+        with self.lock:
+            self.tokens[username] = tokens
+            self.pending[username] = tokens
         
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
         
-        current_time = time.time() * 1000  
-        if 'expiresAt' in tokens and tokens['expiresAt'] < current_time:
-            time_expired = (current_time - tokens['expiresAt']) / 1000 / 60  
-            log(f"警告: 用户 {username or first_username} 的token已过期 {int(time_expired)} 分钟", "WARN")
-        elif 'expiresAt' in tokens:
-            time_remaining = (tokens['expiresAt'] - current_time) / 1000 / 60 
-            log(f"用户 {username or first_username} 的token还有 {int(time_remaining)} 分钟过期", "INFO")
+        if self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.flush_delay, self.flush)
+    
+    def flush(self) -> None:
         
-        log(f"成功读取access token: {tokens.get('accessToken', '')[:10]}...", "SUCCESS")
-        return tokens
+        with self.lock:
+            if self.flush_handle is not None:
+                self.flush_handle.cancel()
+                self.flush_handle = None
+            
+            if not self.pending:
+                return
+            
+            lines = ''.join(
+                json.dumps({'username': username, 'tokens': tokens}, ensure_ascii=False) + '\n'
+                for username, tokens in self.pending.items()
+            )
+            try:
+                with open(self.journal_path, 'a', encoding='utf-8') as f:
+                    f.write(lines)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self.journal_entries += len(self.pending)
+                log("已写入 %s 条token更新", "DEBUG", len(self.pending))
+                self.pending.clear()
+            except Exception as e:
+                log("写入tokens日志失败: %s", "ERROR", str(e))
+                return
+            
+            if self.journal_entries >= self.compact_threshold:
+                self._compact()
+    
+    def _compact(self) -> None:
+        
+        tmp_path = f"{self.snapshot_path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.tokens, f, indent=2, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            open(self.journal_path, 'w').close()
+            self.journal_entries = 0
+            log("tokens.json已压缩，包含 %s 个账户", "INFO", len(self.tokens))
+        except Exception as e:
+            log("压缩tokens文件失败: %s", "ERROR", str(e))
+
+
+token_store = TokenStore(TOKENS_PATH, TOKENS_JOURNAL_PATH)
+
+
+def save_tokens(tokens: Dict, username: str) -> bool:
+   
+    try:
+        if 'expiresIn' in tokens and 'expiresAt' not in tokens:
+            tokens['expiresAt'] = int(time.time() * 1000) + tokens['expiresIn']
+        
+        
+        required_fields = ['accessToken', 'idToken', 'refreshToken']
+        missing_fields = [field for field in required_fields if field not in tokens or not tokens[field]]
+        
+        if missing_fields:
+            log("警告: 用户 %s 的tokens缺少以下字段: %s", "WARN", username, ', '.join(missing_fields))
+        
+        
+        token_store.put(username, tokens)
+        log("已保存用户 %s 的tokens", "INFO", username)
+        return True
     except Exception as e:
-        log(f"读取tokens错误: {str(e)}", "ERROR")
-        raise
+        log("保存tokens错误: %s", "ERROR", str(e))
+        return False
+
+
+def validate_tokens(tokens: Dict) -> bool:
+    
+    required_fields = ['accessToken', 'idToken', 'refreshToken']
+    
+    if not isinstance(tokens, dict):
+        return False
+        
+    for field in required_fields:
+        if field not in tokens or not tokens[field]:
+            return False
+    
+    
+    if 'expiresIn' not in tokens and 'expiresAt' not in tokens:
+        return False
+            
+    return True
+
+
+def decode_jwt_payload(token: str) -> Dict:
+    
+    token_parts = token.split('.')
+    if len(token_parts) != 3:
+        raise ValueError("JWT格式不正确")
+    
+    payload = token_parts[1]
+    payload += '=' * ((4 - len(payload) % 4) % 4)
+    return json.loads(base64.urlsafe_b64decode(payload))
+
+
+def get_token_expiry(token: str) -> int:
+    
+    try:
+        return int(decode_jwt_payload(token)['exp']) * 1000
+    except Exception:
+        return 0
+
+
+COGNITO_SRP_N_HEX = (
+    'FFFFFFFFFFFFFFFFC90FDAA22168C234C4C6628B80DC1CD1'
+    '29024E088A67CC74020BBEA63B139B22514A08798E3404DD'
+    'EF9519B3CD3A431B302B0A6DF25F14374FE1356D6D51C245'
+    'E485B576625E7EC6F44C42E9A637ED6B0BFF5CB6F406B7ED'
+    'EE386BFB5A899FA5AE9F24117C4B1FE649286651ECE45B3D'
+    'C2007CB8A163BF0598DA48361C55D39A69163FA8FD24CF5F'
+    '83655D23DCA3AD961C62F356208552BB9ED529077096966D'
+    '670C354E4ABC9804F1746C08CA18217C32905E462E36CE3B'
+    'E39E772C180E86039B2783A2EC07A28FB5C55DF06F4C52C9'
+    'DE2BCBF6955817183995497CEA956AE515D2261898FA0510'
+    '15728E5A8AAAC42DAD33170D04507A33A85521ABDF1CBA64'
+    'ECFB850458DBEF0A8AEA71575D060C7DB3970F85A6E1E4C7'
+    'ABF5AE8CDB0933D71E8C94E04A25619DCEE3D2261AD2EE6B'
+    'F12FFA06D98A0864D87602733EC86A64521F2B18177B200C'
+    'BBE117577A615D6C770988C0BAD946E208E24FA074E5AB31'
+    '43DB5BFCE0FD108E4B82D120A93AD2CAFFFFFFFFFFFFFFFF'
+)
+COGNITO_SRP_G_HEX = '2'
+COGNITO_SRP_INFO_BITS = b'Caldera Derived Key'
+COGNITO_FATAL_ERRORS = ('NotAuthorizedException', 'UserNotFoundException', 'InvalidParameterException', 'UserNotConfirmedException', 'PasswordResetRequiredException')
+
+
+class CognitoError(Exception):
+
+    def __init__(self, code: str, message: str, status: int = 0):
+        super().__init__(f"{code}: {message}")
+        self.code = code
+        self.message = message
+        self.status = status
+
+
+def _srp_hash_hex(data: bytes) -> str:
+
+    return hashlib.sha256(data).hexdigest().rjust(64, '0')
+
+
+def _srp_pad_hex(value: Union[int, str]) -> str:
+
+    hex_str = value if isinstance(value, str) else '%x' % value
+    if len(hex_str) % 2 == 1:
+        hex_str = '0' + hex_str
+    elif hex_str[0] in '89ABCDEFabcdef':
+        hex_str = '00' + hex_str
+    return hex_str
+
+
+class CognitoSRP:
+
+    N = int(COGNITO_SRP_N_HEX, 16)
+    G = int(COGNITO_SRP_G_HEX, 16)
+    K = int(_srp_hash_hex(bytes.fromhex('00' + COGNITO_SRP_N_HEX + '0' + COGNITO_SRP_G_HEX)), 16)
+
+    def __init__(self, user_pool_id: str, username: str, password: str):
+        self.pool_name = user_pool_id.split('_')[1]
+        self.username = username
+        self.password = password
+        self.small_a = int.from_bytes(os.urandom(128), 'big') % self.N
+        self.large_a = pow(self.G, self.small_a, self.N)
+        if self.large_a % self.N == 0:
+            raise ValueError('SRP A值校验失败')
+
+    def auth_parameters(self) -> Dict:
+
+        return {'USERNAME': self.username, 'SRP_A': '%x' % self.large_a}
+
+    def _password_key(self, user_id: str, server_b: int, salt_hex: str) -> bytes:
+
+        u = int(_srp_hash_hex(bytes.fromhex(_srp_pad_hex(self.large_a) + _srp_pad_hex(server_b))), 16)
+        if u == 0:
+            raise ValueError('SRP U值不能为0')
+
+        user_pass_hash = _srp_hash_hex(f"{self.pool_name}{user_id}:{self.password}".encode('utf-8'))
+        x = int(_srp_hash_hex(bytes.fromhex(_srp_pad_hex(salt_hex) + user_pass_hash)), 16)
+        s = pow(server_b - self.K * pow(self.G, x, self.N), self.small_a + u * x, self.N)
+
+        prk = hmac.new(bytes.fromhex(_srp_pad_hex(u)), bytes.fromhex(_srp_pad_hex(s)), hashlib.sha256).digest()
+        return hmac.new(prk, COGNITO_SRP_INFO_BITS + b'\x01', hashlib.sha256).digest()[:16]
+
+    def challenge_responses(self, challenge: Dict) -> Dict:
+
+        user_id = challenge['USER_ID_FOR_SRP']
+        key = self._password_key(user_id, int(challenge['SRP_B'], 16), challenge['SALT'])
+
+        now = datetime.utcnow()
+        timestamp = f"{now.strftime('%a %b')} {now.day} {now.strftime('%H:%M:%S UTC %Y')}"
+
+        message = (self.pool_name.encode('utf-8') + user_id.encode('utf-8') +
+                   base64.standard_b64decode(challenge['SECRET_BLOCK']) + timestamp.encode('utf-8'))
+        signature = base64.standard_b64encode(hmac.new(key, message, hashlib.sha256).digest()).decode('utf-8')
+
+        return {
+            'TIMESTAMP': timestamp,
+            'USERNAME': user_id,
+            'PASSWORD_CLAIM_SIGNATURE': signature
+        }
+
+
+class CognitoClient:
+
+
+    def __init__(self, config: Dict):
+        self.config = config
+        self.region = config['cognito']['region']
+        self.client_id = config['cognito']['clientId']
+        self.user_pool_id = config['cognito']['userPoolId']
+        self.endpoint = config['cognito'].get('endpoint', f"https://cognito-idp.{self.region}.amazonaws.com/")
+
+    async def _call(self, action: str, payload: Dict) -> Dict:
+
+        session = get_http_session(self.config)
+        headers = {
+            'Content-Type': 'application/x-amz-json-1.1',
+            'X-Amz-Target': f"AWSCognitoIdentityProviderService.{action}"
+        }
+
+        with tracer.span('http', endpoint='cognito', action=action) as span:
+            started = time.monotonic()
+            try:
+                async with session.post(
+                    self.endpoint,
+                    data=json.dumps(payload),
+                    headers=headers,
+                    timeout=get_http_timeout(self.config, 'cognito')
+                ) as response:
+                    body = await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                record_http_response('cognito', 0, time.monotonic() - started)
+                raise
+            
+            record_http_response('cognito', response.status, time.monotonic() - started)
+            span.status = response.status
+        try:
+            data = json.loads(body) if body else {}
+        except json.JSONDecodeError:
+            data = {}
+
+        if response.status >= 400:
+            code = str(data.get('__type', f"HTTP{response.status}")).split('#')[-1]
+            raise CognitoError(code, data.get('message', data.get('Message', '')), response.status)
+
+        return data
+
+    @staticmethod
+    def _tokens_from_result(result: Dict, refresh_token: Optional[str] = None) -> Dict:
+
+        auth_result = result.get('AuthenticationResult')
+        if not auth_result:
+            raise CognitoError('ChallengeNotSupported', f"不支持的认证挑战: {result.get('ChallengeName')}")
+
+        return {
+            'accessToken': auth_result.get('AccessToken'),
+            'idToken': auth_result.get('IdToken'),
+            'refreshToken': auth_result.get('RefreshToken', refresh_token),
+            'expiresIn': auth_result.get('ExpiresIn', 3600)
+        }
+
+    async def refresh(self, refresh_token: str) -> Dict:
+
+        result = await self._call('InitiateAuth', {
+            'AuthFlow': 'REFRESH_TOKEN_AUTH',
+            'ClientId': self.client_id,
+            'AuthParameters': {'REFRESH_TOKEN': refresh_token}
+        })
+        return self._tokens_from_result(result, refresh_token)
+
+    async def authenticate_srp(self, username: str, password: str) -> Dict:
+
+        srp = CognitoSRP(self.user_pool_id, username, password)
+        result = await self._call('InitiateAuth', {
+            'AuthFlow': 'USER_SRP_AUTH',
+            'ClientId': self.client_id,
+            'AuthParameters': srp.auth_parameters()
+        })
+
+        if result.get('ChallengeName') != 'PASSWORD_VERIFIER':
+            return self._tokens_from_result(result)
+
+        loop = asyncio.get_running_loop()
+        responses = await loop.run_in_executor(None, srp.challenge_responses, result['ChallengeParameters'])
+
+        payload = {
+            'ChallengeName': 'PASSWORD_VERIFIER',
+            'ClientId': self.client_id,
+            'ChallengeResponses': responses
+        }
+        if result.get('Session'):
+            payload['Session'] = result['Session']
+
+        result = await self._call('RespondToAuthChallenge', payload)
+        return self._tokens_from_result(result)
 
 
 class CognitoAuth:
@@ -330,7 +1231,8 @@ class CognitoAuth:
         self.region = config['cognito']['region']
         self.client_id = config['cognito']['clientId']
         self.user_pool_id = config['cognito']['userPoolId']
-        self.auth_url = f"https://cognito-idp.{self.region}.amazonaws.com/"
+        self.client = CognitoClient(config)
+        self.auth_url = self.client.endpoint
         self.logger = logging.getLogger(__name__)
         
         
@@ -346,395 +1248,659 @@ class CognitoAuth:
         proxy = self.proxies[self.current_proxy_index]
         self.current_proxy_index = (self.current_proxy_index + 1) % len(self.proxies)
         
-        log(f"使用代理: {proxy}", "INFO")
+        log("使用代理: %s", "INFO", proxy)
         return {
             'http': proxy,
             'https': proxy
         }
     
-    def _save_tokens(self, username, tokens):
-        
-        try:
-            
-            tokens_data = {}
-            try:
-                with open(TOKENS_PATH, 'r', encoding='utf-8') as f:
-                    content = f.read().strip()
-                    if content:
-                        tokens_data = json.loads(content)
-            except (FileNotFoundError, json.JSONDecodeError) as e:
-                self.logger.warning(f"无法读取tokens.json文件: {str(e)}")
-                
-                tokens_data = {}
-            
-            
-            tokens_data[username] = tokens
-            
-            
-            with open(TOKENS_PATH, 'w', encoding='utf-8') as f:
-                json.dump(tokens_data, f, indent=2, ensure_ascii=False)
-            
-            self.logger.info(f"成功保存用户 {username} 的tokens")
-            return True
-        
-        except Exception as e:
-            self.logger.error(f"保存tokens时发生错误: {str(e)}")
-            return False
-    
-    def test_token(self, access_token: str) -> bool:
-        
+    async def test_token(self, access_token: str) -> bool:
+
         try:
-            
-            url = 'https://app-api.jp.stork-oracle.network/v1/me'
-            headers = {
-                'Authorization': f"Bearer {access_token}",
-                'Content-Type': 'application/json',
-                'Origin': 'chrome-extension://knnliglhgkmlblppdejchidfihjnockl',
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/133.0.0.0 Safari/537.36'
-            }
-            
-            response = requests.get(
-                url,
-                headers=headers,
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                log(f"Token for {self.username[:3]}***@***{self.username[-3:]} is valid", "SUCCESS")
+
+            stork_api = StorkAPI(self.config)
+            status, _, _ = await stork_api._request('GET', '/v1/me', 'me', {'accessToken': access_token})
+
+            if status == 200:
+                log("Token for %s***@***%s is valid", "SUCCESS", self.username[:3], self.username[-3:])
                 return True
             else:
-                log(f"Token for {self.username[:3]}***@***{self.username[-3:]} is invalid: {response.status_code}", "WARN")
+                log("Token for %s***@***%s is invalid: %s", "WARN", self.username[:3], self.username[-3:], status)
                 return False
                 
         except Exception as e:
-            log(f"Error testing token: {str(e)}", "ERROR")
+            log("Error testing token: %s", "ERROR", str(e))
             return False
     
-    def authenticate(self, username, password):
-       
-        log(f"Authenticating user {username[:3]}***@***{username[-3:]}")
-        
-        
+    async def _with_retries(self, operation, action: str) -> Dict:
+
         max_retries = 5
         retry_delay = 30
         last_error = None
-        
+
         for attempt in range(max_retries):
             try:
-                log(f"认证尝试 {attempt+1}/{max_retries}")
-                
-                
-                u = Cognito(
-                    user_pool_id=self.user_pool_id,
-                    client_id=self.client_id,
-                    username=username
-                )
-                
-                
-                u.authenticate(password=password)
-                
-                
-                access_token = u.access_token
-                id_token = u.id_token
-                refresh_token = u.refresh_token
-                expires_in = 3600  
-                
-                if not access_token or not id_token or not refresh_token:
-                    log("认证成功但未获取到完整的token", "ERROR")
-                    raise Exception("认证成功但未获取到完整的token")
-                
-                
-                expires_at = int(time.time() * 1000) + (expires_in * 1000)
-                
-                
-                tokens = {
-                    'accessToken': access_token,
-                    'idToken': id_token,
-                    'refreshToken': refresh_token,
-                    'expiresIn': expires_in * 1000,  
-                    'expiresAt': expires_at
-                }
-                
-                
-                self._save_tokens(username, tokens)
-                log(f"用户 {username} 认证成功")
-                
-                return tokens
-                
-            except Exception as e:
-                log(f"认证错误: {str(e)}", "ERROR")
-                last_error = Exception(f"认证失败: {str(e)}")
-                
-                
-                error_str = str(e).lower()
-                if "too many requests" in error_str or "throttling" in error_str:
+                log("%s尝试 %s/%s", "INFO", action, attempt+1, max_retries)
+                return await operation()
+
+            except CognitoError as e:
+                log("%s错误: %s", "ERROR", action, str(e))
+                last_error = Exception(f"{action}失败: {str(e)}")
+
+                if e.code in COGNITO_FATAL_ERRORS:
+                    raise last_error
+
+                if e.code in ('TooManyRequestsException', 'ThrottlingException', 'LimitExceededException'):
                     wait_time = retry_delay * (2 ** attempt)
-                    log(f"请求过多，等待 {wait_time} 秒后重试", "WARN")
-                    time.sleep(wait_time)
-                    continue
-                
-                
-                if "connection" in error_str or "timeout" in error_str:
+                    log("请求过多，等待 %s 秒后重试", "WARN", wait_time)
+                else:
                     wait_time = retry_delay * (2 ** attempt)
-                    log(f"连接错误，等待 {wait_time} 秒后重试", "WARN")
-                    time.sleep(wait_time)
-                    continue
-                
-                
+                    log("%s错误，等待 %s 秒后重试", "WARN", action, wait_time)
+                await asyncio.sleep(wait_time)
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                log("%s错误: %s", "ERROR", action, str(e) or type(e).__name__)
+                last_error = Exception(f"{action}失败: {str(e) or type(e).__name__}")
                 wait_time = retry_delay * (2 ** attempt)
-                log(f"认证错误，等待 {wait_time} 秒后重试", "WARN")
-                time.sleep(wait_time)
-        
-        
+                log("连接错误，等待 %s 秒后重试", "WARN", wait_time)
+                await asyncio.sleep(wait_time)
+
         if last_error:
             raise last_error
         else:
-            raise Exception("认证失败: 达到最大重试次数")
+            raise Exception(f"{action}失败: 达到最大重试次数")
+
+    async def authenticate(self, username, password):
+       
+        log("Authenticating user %s***@***%s", "INFO", username[:3], username[-3:])
+        
+        result = await self._with_retries(lambda: self.client.authenticate_srp(username, password), "认证")
+        
+        if not result['accessToken'] or not result['idToken'] or not result['refreshToken']:
+            log("认证成功但未获取到完整的token", "ERROR")
+            raise Exception("认证成功但未获取到完整的token")
+        
+        
+        expires_in = result['expiresIn']
+        tokens = {
+            'accessToken': result['accessToken'],
+            'idToken': result['idToken'],
+            'refreshToken': result['refreshToken'],
+            'expiresIn': expires_in * 1000,  
+            'expiresAt': get_token_expiry(result['accessToken']) or int(time.time() * 1000) + (expires_in * 1000)
+        }
+        
+        
+        log("用户 %s 认证成功", "INFO", username)
+        
+        return tokens
     
-    def refresh_session(self, refresh_token: str) -> Dict:
+    async def refresh_session(self, refresh_token: str) -> Dict:
        
-        log(f"刷新用户token...")
+        log("刷新用户token...")
         
+        result = await self._with_retries(lambda: self.client.refresh(refresh_token), "刷新token")
         
-        max_retries = 5
-        retry_delay = 30
-        last_error = None
+        if not result['accessToken'] or not result['idToken']:
+            log("刷新token成功但未获取到完整的token", "ERROR")
+            raise Exception("刷新token成功但未获取到完整的token")
         
-        for attempt in range(max_retries):
+        
+        expires_in = result['expiresIn']
+        tokens = {
+            'accessToken': result['accessToken'],
+            'idToken': result['idToken'],
+            'refreshToken': result['refreshToken'],  
+            'expiresIn': expires_in * 1000,  
+            'expiresAt': get_token_expiry(result['accessToken']) or int(time.time() * 1000) + (expires_in * 1000)
+        }
+        
+        log("成功刷新token")
+        return tokens
+
+
+class TokenManager:
+    
+    
+    def __init__(self, account: Dict, config: Dict):
+        self.access_token = None
+        self.refresh_token = None
+        self.id_token = None
+        self.expires_at = 0
+        self.last_refresh_time = 0
+        self.retry_at = 0
+        self.refresh_margin = config.get('auth', {}).get('refreshMarginSeconds', 300)
+        self.outcome_ttl = {"success": 30, "throttled": 120, "failed": 30}
+        self.outcome_ttl.update(config.get('auth', {}).get('outcomeTtlSeconds', {}))
+        self.refresh_future: Optional[asyncio.Future] = None
+        self.last_outcome: Optional[Tuple[str, float, Optional[Exception]]] = None
+        self.username = account.get('username', account.get('email', ''))
+        self.password = account.get('password', '')
+        self.auth = CognitoAuth(self.username, self.password, config)
+    
+    def load_tokens(self, tokens: Dict) -> bool:
+        
+        if not validate_tokens(tokens):
+            return False
+        
+        self.access_token = tokens['accessToken']
+        self.id_token = tokens['idToken']
+        self.refresh_token = tokens['refreshToken']
+        self.expires_at = get_token_expiry(tokens['accessToken']) or tokens.get('expiresAt', 0)
+        return True
+    
+    def is_token_valid(self) -> bool:
+        
+        return bool(self.access_token) and self.expires_at > time.time() * 1000
+    
+    def refresh_due_at(self) -> float:
+        
+        if not self.access_token:
+            return max(self.retry_at, 0)
+        return max(self.expires_at / 1000 - self.refresh_margin, self.retry_at)
+    
+    async def get_valid_token(self) -> str:
+      
+        if self.is_token_valid():
+            return self.access_token
+        
+        
+        log("用户 %s 没有可用的token，同步获取", "WARN", self.username)
+        await self.refresh_or_authenticate()
+        return self.access_token
+    
+    def _cached_outcome(self) -> Optional[Tuple[str, float, Optional[Exception]]]:
+        
+        if self.last_outcome is None:
+            return None
+        status, at, error = self.last_outcome
+        if time.time() - at < self.outcome_ttl.get(status, 0):
+            return self.last_outcome
+        return None
+    
+    def _record_outcome(self, status: str, error: Optional[Exception] = None) -> None:
+        
+        TOKEN_REFRESHES_TOTAL.inc(status)
+        now = time.time()
+        self.last_outcome = (status, now, error)
+        self.retry_at = 0 if status == "success" else now + self.outcome_ttl.get(status, 0)
+    
+    async def refresh_or_authenticate(self) -> None:
+        
+        if self.refresh_future is not None and not self.refresh_future.done():
+            log("用户 %s 的token刷新正在进行，等待同一结果", "DEBUG", self.username)
+            await asyncio.shield(self.refresh_future)
+            return
+        
+        cached = self._cached_outcome()
+        if cached is not None:
+            status, _, error = cached
+            log("复用 %s 秒前的token刷新结果: %s", "DEBUG", int(time.time() - cached[1]), status)
+            if error is not None and not self.is_token_valid():
+                raise error
+            return
+        
+        self.refresh_future = asyncio.ensure_future(self._refresh_once())
+        await asyncio.shield(self.refresh_future)
+    
+    async def _refresh_once(self) -> None:
+       
+        try:
+            result = None
+            if self.refresh_token:
+                try:
+                    log("尝试使用refresh_token刷新token", "INFO")
+                    result = await self.auth.refresh_session(self.refresh_token)
+                except Exception as e:
+                    if "TooManyRequestsException" in str(e):
+                        raise
+                    log("刷新token失败，尝试重新认证: %s", "WARN", str(e))
+                    result = await self.auth.authenticate(self.username, self.password)
+            else:
+                log("没有refresh_token，尝试重新认证", "INFO")
+                result = await self.auth.authenticate(self.username, self.password)
+            
+            self.access_token = result['accessToken']
+            self.id_token = result['idToken']
+            self.refresh_token = result['refreshToken']
+            self.expires_at = result['expiresAt']
+            self.last_refresh_time = time.time()
+            self._record_outcome("success")
+            
+            save_tokens(result, self.username)
+            log("Token已刷新，%s 分钟后过期", "SUCCESS", int((self.expires_at / 1000 - time.time()) / 60))
+            
+        except Exception as e:
+            if "TooManyRequestsException" in str(e):
+                self._record_outcome("throttled", e)
+                log("Token请求过于频繁，%s秒后重试", "WARN", self.outcome_ttl['throttled'])
+            else:
+                self._record_outcome("failed", e)
+                if "NotAuthorizedException" in str(e):
+                    log("认证失败：无效的凭证", "ERROR")
+                elif "UserNotFoundException" in str(e):
+                    log("认证失败：用户不存在", "ERROR")
+                elif "InvalidParameterException" in str(e):
+                    log("认证失败：无效的参数", "ERROR")
+                else:
+                    log("Token刷新/认证错误: %s", "ERROR", str(e))
+            
+            if not self.is_token_valid():
+                raise
+            log("继续使用当前token", "WARN")
+        finally:
+            token_refresh_scheduler.wake()
+
+
+class TokenRefreshScheduler:
+    
+    
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.wake_event: Optional[asyncio.Event] = None
+        self.refreshing: Dict[str, asyncio.Task] = {}
+    
+    def start(self) -> None:
+        
+        if self.task is None or self.task.done():
+            self.wake_event = asyncio.Event()
+            self.task = asyncio.create_task(self._run())
+    
+    def wake(self) -> None:
+        
+        if self.wake_event is not None:
+            self.wake_event.set()
+    
+    async def stop(self) -> None:
+        
+        tasks = list(self.refreshing.values())
+        if self.task is not None:
+            tasks.append(self.task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.refreshing.clear()
+        self.task = None
+    
+    async def _refresh(self, token_manager: TokenManager) -> None:
+        
+        try:
+            await token_manager.refresh_or_authenticate()
+        except Exception as e:
+            log("后台刷新用户 %s 的token失败: %s", "ERROR", token_manager.username, str(e))
+        finally:
+            self.refreshing.pop(token_manager.username, None)
+    
+    async def _run(self) -> None:
+        
+        while True:
             try:
-                log(f"刷新token尝试 {attempt+1}/{max_retries}")
-                
-                
-                u = Cognito(
-                    user_pool_id=self.user_pool_id,
-                    client_id=self.client_id,
-                    refresh_token=refresh_token
-                )
-                
-                
-                u.renew_access_token()
-                
-                
-                access_token = u.access_token
-                id_token = u.id_token
-                expires_in = 3600  
-                
-                if not access_token or not id_token:
-                    log("刷新token成功但未获取到完整的token", "ERROR")
-                    raise Exception("刷新token成功但未获取到完整的token")
-                
-                
-                expires_at = int(time.time() * 1000) + (expires_in * 1000)
-                
+                managers = list(token_managers.values())
+                now = time.time()
                 
-                tokens = {
-                    'accessToken': access_token,
-                    'idToken': id_token,
-                    'refreshToken': refresh_token,  
-                    'expiresIn': expires_in * 1000,  
-                    'expiresAt': expires_at
-                }
+                for token_manager in managers:
+                    if token_manager.username not in self.refreshing and token_manager.refresh_due_at() <= now:
+                        self.refreshing[token_manager.username] = asyncio.create_task(self._refresh(token_manager))
                 
-                log(f"成功刷新token")
-                return tokens
+                due_times = [token_manager.refresh_due_at() for token_manager in managers]
+                delay = max(1, min(due_times) - time.time()) if due_times else None
                 
+                self.wake_event.clear()
+                try:
+                    await asyncio.wait_for(self.wake_event.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
-                log(f"刷新token错误: {str(e)}", "ERROR")
-                last_error = Exception(f"刷新token失败: {str(e)}")
-                
-                
-                error_str = str(e).lower()
-                if "too many requests" in error_str or "throttling" in error_str:
-                    wait_time = retry_delay * (2 ** attempt)
-                    log(f"请求过多，等待 {wait_time} 秒后重试", "WARN")
-                    time.sleep(wait_time)
-                    continue
-                
-                
-                if "connection" in error_str or "timeout" in error_str:
-                    wait_time = retry_delay * (2 ** attempt)
-                    log(f"连接错误，等待 {wait_time} 秒后重试", "WARN")
-                    time.sleep(wait_time)
+                log("Token刷新调度出错: %s", "ERROR", str(e))
+                await asyncio.sleep(60)
+
+
+token_refresh_scheduler = TokenRefreshScheduler()
+
+
+token_managers: Dict[str, TokenManager] = {}
+
+
+def get_token_manager(account: Dict, config: Dict) -> TokenManager:
+    
+    username = account.get('username', account.get('email', ''))
+    token_manager = token_managers.get(username)
+    if token_manager is None:
+        token_manager = TokenManager(account, config)
+        token_managers[username] = token_manager
+    return token_manager
+
+
+def hydrate_token_managers(account_list: List[Dict], config: Dict) -> int:
+    
+    all_tokens = token_store.load()
+    
+    loaded = 0
+    for account in account_list:
+        token_manager = get_token_manager(account, config)
+        cached = all_tokens.get(token_manager.username)
+        if cached and token_manager.load_tokens(cached):
+            loaded += 1
+    
+    log("从token存储恢复了 %s/%s 个账户的token缓存", "INFO", loaded, len(account_list))
+    return loaded
+
+
+class RateLimiter:
+    
+    
+    def __init__(self, rate: float, burst: float, min_rate: float, max_rate: float, increase: float, decrease: float):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock: Optional[asyncio.Lock] = None
+    
+    def _refill(self, now: float) -> None:
+        
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    async def acquire(self) -> None:
+        
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
                     continue
                 
-                
-                wait_time = retry_delay * (2 ** attempt)
-                log(f"刷新token错误，等待 {wait_time} 秒后重试", "WARN")
-                time.sleep(wait_time)
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+    
+    def on_success(self) -> None:
         
+        self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+    
+    def on_throttle(self, retry_after: Optional[float] = None) -> None:
         
-        if last_error:
-            raise last_error
-        else:
-            raise Exception("刷新token失败: 达到最大重试次数")
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        self.tokens = min(self.tokens, 0)
+        wait_time = retry_after if retry_after is not None else 1 / self.rate
+        self.blocked_until = max(self.blocked_until, time.monotonic() + wait_time)
+        log("触发频率限制，速率降至 %.2f 次/秒，暂停 %.1f 秒", "WARN", self.rate, wait_time)
+
+
+stork_rate_limiter: Optional[RateLimiter] = None
 
 
-class TokenManager:
+def get_rate_limiter(config: Dict) -> RateLimiter:
     
+    global stork_rate_limiter
     
-    def __init__(self, account: Dict, config: Dict):
-        self.access_token = None
-        self.refresh_token = None
-        self.id_token = None
-        self.expires_at = 0
-        self.last_refresh_time = 0
-        self.refresh_interval = 50 * 60  
-        self.username = account.get('username', account.get('email', ''))
-        self.password = account.get('password', '')
-        self.auth = CognitoAuth(self.username, self.password, config)
+    if stork_rate_limiter is None:
+        rate_config = config.get('rateLimit', {})
+        stork_rate_limiter = RateLimiter(
+            rate=rate_config.get('ratePerSecond', 5),
+            burst=rate_config.get('burst', 10),
+            min_rate=rate_config.get('minRate', 0.5),
+            max_rate=rate_config.get('maxRate', 50),
+            increase=rate_config.get('increasePerSecond', 0.5),
+            decrease=rate_config.get('decreaseFactor', 0.5)
+        )
+    return stork_rate_limiter
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
     
-    def should_refresh_token(self) -> bool:
-       
-        current_time = time.time() * 1000  
-        
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class PriceRecord:
+    
+    
+    __slots__ = ('asset', 'msg_hash', 'raw_price', 'timestamp_ns', 'signature')
+    
+    def __init__(self, asset: str, msg_hash: bytes, raw_price: int, timestamp_ns: int, signature: Optional[Dict] = None):
+        self.asset = asset
+        self.msg_hash = msg_hash
+        self.raw_price = raw_price
+        self.timestamp_ns = timestamp_ns
+        self.signature = signature
+    
+    @property
+    def msg_hash_hex(self) -> str:
         
-        if not self.access_token:
-            log("无token，需要获取新token", "INFO")
-            return True
+        return '0x' + self.msg_hash.hex()
+    
+    @property
+    def price(self) -> float:
         
+        return self.raw_price / 1e18
+    
+    @property
+    def timestamp(self) -> str:
         
-        if self.expires_at <= 0 or self.expires_at < current_time:
-            log("Token已过期或expires_at无效，需要刷新", "INFO")
-            return True
+        return datetime.fromtimestamp(self.timestamp_ns / 1e9).isoformat()
+    
+    @property
+    def fresh_until(self) -> float:
         
+        return self.timestamp_ns / 1e9 + PRICE_FRESHNESS_SECONDS
+    
+    def __repr__(self) -> str:
         
-        time_until_expiry_sec = (self.expires_at - current_time) / 1000
-        time_until_expiry_min = int(time_until_expiry_sec / 60)
-        log(f"Token还剩 {time_until_expiry_min} 分钟过期", "INFO")
+        return f"PriceRecord({self.asset}, {self.msg_hash_hex}, {self.price:.8f}, {self.timestamp})"
+
+
+class PriceBatch:
+    
+    
+    __slots__ = ('records', 'timestamps_ns', 'prices')
+    
+    def __init__(self):
+        self.records: List[PriceRecord] = []
+        self.timestamps_ns = array.array('q')
+        self.prices = array.array('d')
+    
+    def append(self, record: PriceRecord) -> None:
         
+        self.timestamps_ns.append(record.timestamp_ns)
+        self.prices.append(record.price)
+        self.records.append(record)
+    
+    def __len__(self) -> int:
         
-        if time_until_expiry_sec < 1800 and (time.time() - self.last_refresh_time > 3600):
-            log(f"Token将在 {time_until_expiry_min} 分钟后过期，且距离上次刷新超过1小时，需要刷新", "INFO")
-            return True
+        return len(self.records)
+    
+    def __iter__(self):
         
-        return False
+        return iter(self.records)
+
+
+def parse_timestamp_ns(timestamp: Union[int, float, str]) -> int:
     
-    async def get_valid_token(self) -> str:
-      
+    if isinstance(timestamp, str):
+        timestamp = timestamp.replace('0x', '').strip()
         try:
-            
-            if self.access_token and not self.should_refresh_token():
-                return self.access_token
-            
-            
-            if self.should_refresh_token():
-                try:
-                    await self.refresh_or_authenticate()
-                except Exception as e:
-                    
-                    if "TooManyRequestsException" in str(e) and self.access_token:
-                        log("Token请求过于频繁，继续使用当前token", "WARN")
-                        
-                        current_time = time.time() * 1000
-                        if self.expires_at < current_time + 600000:  
-                            self.expires_at = current_time + 1800000  
-                            log("临时延长token过期时间30分钟，避免频繁刷新", "INFO")
-                        return self.access_token
-                    elif "InvalidParameterException" in str(e) and self.access_token:
-                        log("无效的参数，继续使用当前token", "WARN")
-                        return self.access_token
-                    else:
-                        raise
-            return self.access_token
-        except Exception as e:
-            if "TooManyRequestsException" in str(e):
-                log("Token请求过于频繁，继续使用当前token", "WARN")
-                
-                if self.access_token:
-                    
-                    current_time = time.time() * 1000
-                    if self.expires_at < current_time + 600000:  
-                        self.expires_at = current_time + 1800000  
-                        log("临时延长token过期时间30分钟，避免频繁刷新", "INFO")
-                    return self.access_token
-            elif "InvalidParameterException" in str(e):
-                log("无效的参数，继续使用当前token", "WARN")
-                if self.access_token:
-                    return self.access_token
-            raise
+            timestamp = int(timestamp, 16)
+        except ValueError:
+            timestamp = int(float(timestamp))
+    else:
+        timestamp = int(timestamp)
     
-    async def refresh_or_authenticate(self) -> None:
-       
-        current_time = time.time() * 1000  
+    if timestamp > 9999999999999999:
+        return timestamp
+    if timestamp > 9999999999999:
+        return timestamp * 1000
+    if timestamp > 9999999999:
+        return timestamp * 1000000
+    return timestamp * 1000000000
+
+
+def parse_signed_price(asset_key: str, asset_data: Any) -> Optional[PriceRecord]:
+    
+    try:
+        if not isinstance(asset_data, dict):
+            log("跳过无效的资产数据: %s", "WARN", asset_key)
+            return None
         
         
-        if self.access_token and self.expires_at > 0:
-            time_until_expiry_sec = (self.expires_at - current_time) / 1000
-            
-            
-            if time_until_expiry_sec > 7200:  
-                log(f"Token仍然有效，剩余 {int(time_until_expiry_sec/60)} 分钟，无需刷新", "INFO")
-                return
-            
-            
-            if time_until_expiry_sec > 1800 and ((current_time/1000) - self.last_refresh_time < 14400): 
-                log(f"Token仍然有效，剩余 {int(time_until_expiry_sec/60)} 分钟，且距离上次刷新不到4小时，无需刷新", "INFO")
-                return
+        timestamped_sig = asset_data.get('timestamped_signature', {})
+        if not isinstance(timestamped_sig, dict):
+            log("资产 %s 的时间戳签名格式无效", "WARN", asset_key)
+            return None
         
        
-        if self.last_refresh_time > 0 and (time.time() - self.last_refresh_time < 1800): 
-            log(f"最近30分钟内已尝试刷新token，跳过本次刷新", "INFO")
-            return
+        msg_hash = timestamped_sig.get('msg_hash')
+        if not msg_hash:
+            log("资产 %s 缺少msg_hash", "WARN", asset_key)
+            return None
         
         
-        max_retries = 2  
-        retry_delay = 60  
+        price = asset_data.get('price')
+        if not price:
+            log("资产 %s 缺少价格数据", "WARN", asset_key)
+            return None
         
-        for attempt in range(max_retries):
-            try:
-                result = None
-                if self.refresh_token:
-                    try:
-                        log(f"尝试使用refresh_token刷新token", "INFO")
-                        result = self.auth.refresh_session(self.refresh_token)
-                    except Exception as e:
-                        if "TooManyRequestsException" in str(e):
-                            log(f"刷新token请求过于频繁，等待下次尝试", "WARN")
-                            
-                            return
-                        log(f"刷新token失败，尝试重新认证: {str(e)}", "WARN")
-                        result = self.auth.authenticate(self.username, self.password)
-                else:
-                    log(f"没有refresh_token，尝试重新认证", "INFO")
-                    result = self.auth.authenticate(self.username, self.password)
-                
-                self.access_token = result['accessToken']
-                self.id_token = result['idToken']
-                self.refresh_token = result['refreshToken']
-                self.expires_at = result.get('expiresAt', time.time() * 1000 + result['expiresIn']) 
-                self.last_refresh_time = time.time()
-                
-                log('Token已刷新', "SUCCESS")
-                return
-                
-            except Exception as e:
-                
-                if "TooManyRequestsException" in str(e):
-                    wait_time = retry_delay * (2 ** attempt)  
-                    log(f"Token请求过于频繁，等待{wait_time}秒后重试", "WARN")
-                    await asyncio.sleep(wait_time)
-                    continue
-                elif "NotAuthorizedException" in str(e):
-                    log("认证失败：无效的凭证", "ERROR")
-                    raise
-                elif "UserNotFoundException" in str(e):
-                    log("认证失败：用户不存在", "ERROR")
-                    raise
-                elif "InvalidParameterException" in str(e):
-                    log("认证失败：无效的参数", "ERROR")
-                   
-                    raise
-                else:
-                    log(f"Token刷新/认证错误: {str(e)}", "ERROR")
-                    raise
         
-        raise Exception("Token刷新失败：达到最大重试次数")
+        timestamp = timestamped_sig.get('timestamp')
+        if not timestamp:
+            log("资产 %s 缺少时间戳", "WARN", asset_key)
+            return None
+        
+        
+        try:
+            record = PriceRecord(
+                asset_key,
+                bytes.fromhex(msg_hash[2:] if msg_hash.startswith('0x') else msg_hash),
+                int(price),
+                parse_timestamp_ns(timestamp),
+                timestamped_sig.get('signature')
+            )
+            if not record.msg_hash:
+                raise ValueError("msg_hash为空")
+        except (ValueError, TypeError, OverflowError) as e:
+            log("处理资产 %s 的数据时出错: %s", "ERROR", asset_key, str(e))
+            log("错误详情: msg_hash=%s, price=%s, timestamp=%s", "ERROR", msg_hash, price, timestamp)
+            return None
+        
+        log("成功处理资产 %s: %s", "DEBUG", asset_key, record)
+        return record
+        
+    except Exception as e:
+        log("处理资产 %s 时出错: %s", "ERROR", asset_key, str(e))
+        return None
+
+
+def parse_signed_prices(data_obj: Dict) -> PriceBatch:
+    
+    result = PriceBatch()
+    for asset_key, asset_data in data_obj.items():
+        record = parse_signed_price(asset_key, asset_data)
+        if record is not None:
+            result.append(record)
+    return result
+
+
+class SignedPriceStream:
+    
+    
+    TOKEN = re.compile(r'"(?:[^"\\]|\\.)*(?P<closed>")?|[{}\[\]]')
+    SEPARATOR = re.compile(r'[\s,]*')
+    COLON = re.compile(r'\s*:\s*')
+    DECODER = json.JSONDecoder()
+    
+    def __init__(self):
+        self.text = ''
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.position = 0
+        self.depth = 0
+        self.last_string = ''
+        self.in_data = False
+        self.finished = False
+    
+    def _find_data(self) -> None:
+        
+        for match in self.TOKEN.finditer(self.text, self.position):
+            token = match.group()
+            if token[0] == '"':
+                if match.group('closed') is None:
+                    self.position = match.start()
+                    return
+                if self.depth == 1:
+                    self.last_string = token
+            elif token in ('{', '['):
+                self.depth += 1
+                if self.depth == 2 and token == '{' and self.last_string == '"data"':
+                    self.in_data = True
+                    self.position = match.end()
+                    return
+            else:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.finished = True
+                    return
+        self.position = len(self.text)
+    
+    def feed(self, chunk: bytes) -> List[Tuple[str, Any]]:
+        
+        if self.finished:
+            return []
+        
+        self.text += self.utf8.decode(chunk)
+        if not self.in_data:
+            self._find_data()
+        
+        text = self.text
+        members = []
+        while self.in_data:
+            position = self.SEPARATOR.match(text, self.position).end()
+            if position >= len(text):
+                break
+            if text[position] == '}':
+                self.in_data = False
+                self.finished = True
+                break
+            try:
+                key, key_end = self.DECODER.raw_decode(text, position)
+                colon = self.COLON.match(text, key_end)
+                if colon is None:
+                    break
+                value, value_end = self.DECODER.raw_decode(text, colon.end())
+            except json.JSONDecodeError:
+                break
+            if value_end >= len(text) and not isinstance(value, (dict, list)):
+                break
+            members.append((key, value))
+            self.position = value_end
+        
+        self.text = text[self.position:]
+        self.position = 0
+        return members
 
 
 class StorkAPI:
    
     
-    def __init__(self, config: Dict):
+    def __init__(self, config: Dict, proxies: Optional[List[str]] = None):
       
         self.config = config
         self.base_url = config.get('api_url', 'https://app-api.jp.stork-oracle.network')
@@ -742,14 +1908,15 @@ class StorkAPI:
         self.user_agent = config.get('user_agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/133.0.0.0 Safari/537.36')
         
         
-        self.proxies = load_proxies()
+        self.proxies = proxies if proxies is not None else load_proxies()
         self.current_proxy = None
         self.current_proxy_index = 0  
+        self.prices_not_modified = False
         
         if self.proxies and len(self.proxies) > 0:
             self.current_proxy = self.proxies[0]
     
-    def _get_proxy_config(self) -> Dict:
+    def _get_proxy_config(self) -> Optional[str]:
        
         if not self.proxies or len(self.proxies) == 0:
             return None
@@ -759,448 +1926,487 @@ class StorkAPI:
             self.current_proxy_index = 0
             self.current_proxy = self.proxies[0]
         
-        log(f"Trying to run with {self.current_proxy}")
+        proxy = self.current_proxy
+        log("Trying to run with %s", "DEBUG", proxy)
+        
+        
+        self.current_proxy_index = (self.current_proxy_index + 1) % len(self.proxies)
+        self.current_proxy = self.proxies[self.current_proxy_index]
         
+        return proxy
+    
+    def _headers(self, tokens: Dict) -> Dict:
         
-        proxy_config = {
-            'http': self.current_proxy,
-            'https': self.current_proxy
+        return {
+            'Authorization': f"Bearer {tokens['accessToken']}",
+            'Content-Type': 'application/json',
+            'Accept-Encoding': HTTP_ACCEPT_ENCODING,
+            'Origin': self.origin,
+            'User-Agent': self.user_agent
         }
+    
+    def _cache_key(self, endpoint: str, tokens: Dict) -> Optional[Tuple[str, str]]:
+        
+        if not response_cache.enabled:
+            return None
+        return endpoint, tokens.get('username', '')
+    
+    async def _request(self, method: str, path: str, endpoint: str, tokens: Dict, proxy: Optional[str] = None, json_body: Optional[Dict] = None, deadline: Optional[float] = None, cache_key: Optional[Tuple[str, str]] = None) -> Tuple[int, Any, bytes]:
+        
+        session = get_http_session(self.config)
+        rate_limiter = get_rate_limiter(self.config)
+        url = f"{self.base_url}{path}"
+        headers = self._headers(tokens)
+        if cache_key is not None:
+            headers.update(response_cache.request_headers(cache_key))
+        
+        await rate_limiter.acquire()
+        timeout = get_http_timeout(self.config, endpoint, deadline)
+        with tracer.span('http', endpoint=endpoint, method=method) as span:
+            started = time.monotonic()
+            try:
+                async with session.request(
+                    method,
+                    url,
+                    headers=headers,
+                    json=json_body,
+                    proxy=proxy,
+                    timeout=timeout
+                ) as response:
+                    body = await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                record_http_response(endpoint, 0, time.monotonic() - started)
+                raise
+            
+            record_http_response(endpoint, response.status, time.monotonic() - started)
+            span.status = response.status
+        
+        fixture_recorder.record(endpoint, method, path, response.status, response.headers, body)
+        if cache_key is not None and response.status == 200:
+            response_cache.remember(cache_key, response.headers)
+        
+        if response.status == 429:
+            rate_limiter.on_throttle(parse_retry_after(response.headers.get('Retry-After')))
+        elif response.status < 500:
+            rate_limiter.on_success()
+        return response.status, response.headers, body
+    
+    async def _stream_chunks(self, method: str, path: str, endpoint: str, tokens: Dict, proxy: Optional[str] = None, cache_key: Optional[Tuple[str, str]] = None):
+        
+        session = get_http_session(self.config)
+        rate_limiter = get_rate_limiter(self.config)
+        recorded: Optional[List[bytes]] = [] if fixture_recorder.enabled else None
+        headers = self._headers(tokens)
+        if cache_key is not None:
+            headers.update(response_cache.request_headers(cache_key))
+        
+        await rate_limiter.acquire()
+        with tracer.span('http', endpoint=endpoint, method=method, streamed=True) as span:
+            started = time.monotonic()
+            try:
+                async with session.request(
+                    method,
+                    f"{self.base_url}{path}",
+                    headers=headers,
+                    proxy=proxy,
+                    timeout=get_http_timeout(self.config, endpoint, streamed=True)
+                ) as response:
+                    span.status = response.status
+                    if response.status == 429:
+                        rate_limiter.on_throttle(parse_retry_after(response.headers.get('Retry-After')))
+                    elif response.status < 500:
+                        rate_limiter.on_success()
+                    
+                    if response.status >= 400:
+                        body = await response.read()
+                        record_http_response(endpoint, response.status, time.monotonic() - started)
+                        log("错误响应: %s", "ERROR", body.decode('utf-8', errors='replace'))
+                        raise Exception(f"API请求失败: HTTP {response.status}")
+                    if response.status == 304:
+                        record_http_response(endpoint, response.status, time.monotonic() - started)
+                        fixture_recorder.record(endpoint, method, path, response.status, response.headers, b'')
+                        raise NotModified(endpoint)
+                    if cache_key is not None and response.status == 200:
+                        response_cache.remember(cache_key, response.headers)
+                    
+                    async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                        if recorded is not None:
+                            recorded.append(chunk)
+                        yield chunk
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                record_http_response(endpoint, 0, time.monotonic() - started)
+                raise
+            
+            record_http_response(endpoint, response.status, time.monotonic() - started)
         
+        if recorded is not None:
+            fixture_recorder.record(endpoint, method, path, response.status, response.headers, b''.join(recorded))
+    
+    async def stream_signed_prices(self, tokens: Dict):
         
-        self.current_proxy_index = (self.current_proxy_index + 1) % len(self.proxies)
-        self.current_proxy = self.proxies[self.current_proxy_index]
+        proxy = self._get_proxy_config()
+        cache_key = self._cache_key('prices-stream', tokens)
+        splitter = SignedPriceStream()
+        chunks = self._stream_chunks('GET', '/v1/stork_signed_prices', 'prices', tokens, proxy, cache_key)
+        count = 0
+        try:
+            async for chunk in chunks:
+                for asset_key, asset_data in splitter.feed(chunk):
+                    record = parse_signed_price(asset_key, asset_data)
+                    if record is not None:
+                        count += 1
+                        yield record
+        except NotModified:
+            self.prices_not_modified = True
+            log("价格数据未变化（304），上次的 %s 个价格均已处理，本轮跳过", "INFO", response_cache.cached(cache_key))
+            return
+        finally:
+            await chunks.aclose()
+        if cache_key is not None:
+            response_cache.commit(cache_key, count)
+        log("总共流式处理了 %s 个有效价格数据", "SUCCESS", count)
+    
+    def forget_streamed_prices(self, tokens: Dict) -> None:
         
-        return proxy_config
+        cache_key = self._cache_key('prices-stream', tokens)
+        if cache_key is not None:
+            response_cache.invalidate(cache_key)
     
-    async def get_signed_prices(self, tokens: Dict) -> List[Dict]:
+    async def get_signed_prices(self, tokens: Dict) -> PriceBatch:
         
         log("开始获取签名价格数据...", "INFO")
         
-        proxy_config = self._get_proxy_config()
-        proxy = proxy_config.get("proxy")
+        proxy = self._get_proxy_config()
         
         if proxy:
-            log(f"使用代理获取价格数据: {proxy}", "INFO")
+            log("使用代理获取价格数据: %s", "API", proxy)
         
         url = f"{self.base_url}/v1/stork_signed_prices"
         
-        log(f"Request URL: {url}", "INFO")
-        log(f"Request Method: GET", "INFO")
-        
         try:
-            headers = {
-                'Authorization': f"Bearer {tokens['accessToken']}",
-                'Content-Type': 'application/json',
-                'Origin': self.origin,
-                'User-Agent': self.user_agent
-            }
-            
-            proxies = self._get_proxy_config()
-            if proxies:
-                log(f"使用代理获取价格数据: {self.current_proxy}", "API")
+            log("Request URL: %s", "API", url)
+            log("Request Method: GET", "API")
             
+            cache_key = self._cache_key('prices', tokens)
+            status, response_headers, body = await self._request('GET', '/v1/stork_signed_prices', 'prices', tokens, proxy, cache_key=cache_key)
             
-            log(f"Request URL: {url}", "API")
-            log(f"Request Method: GET", "API")
-            log(f"Request Headers: {headers}", "API")
             
-            response = requests.get(
-                url,
-                headers=headers,
-                proxies=proxies,
-                timeout=30
-            )
+            log("Response Status: %s", "API", status)
+            log("Response Headers: %s", "API", response_headers)
             
+            if status == 304:
+                result = response_cache.cached(cache_key)
+                log("价格数据未变化（304），复用上次解析的 %s 个价格", "INFO", len(result))
+                return result
             
-            log(f"Response Status: {response.status_code}", "API")
-            log(f"Response Headers: {dict(response.headers)}", "API")
+            if status >= 400:
+                log("错误响应: %s", "ERROR", body.decode('utf-8', errors='replace'))
+                raise Exception(f"API请求失败: HTTP {status}")
             
-            response.raise_for_status()
-            data = response.json()
+            data = json.loads(body)
             
             
-            log(f"Raw Response Data Structure: {json.dumps(data, indent=2)[:500]}...", "API")
+            log("Raw Response Data Structure: %s...", "API", LazyValue(lambda: json.dumps(data, indent=2)[:500]))
             
             if not data or not isinstance(data.get('data'), dict):
                 log("响应数据为空或格式不正确", "ERROR")
-                return []
+                return PriceBatch()
             
             
-            result = []
-            data_obj = data.get('data', {})
-            for asset_key, asset_data in data_obj.items():
-                try:
-                    if not isinstance(asset_data, dict):
-                        log(f"跳过无效的资产数据: {asset_key}", "WARN")
-                        continue
-                    
-                    
-                    timestamped_sig = asset_data.get('timestamped_signature', {})
-                    if not isinstance(timestamped_sig, dict):
-                        log(f"资产 {asset_key} 的时间戳签名格式无效", "WARN")
-                        continue
-                    
-                   
-                    msg_hash = timestamped_sig.get('msg_hash')
-                    if not msg_hash:
-                        log(f"资产 {asset_key} 缺少msg_hash", "WARN")
-                        continue
-                    
-                    
-                    price = asset_data.get('price')
-                    if not price:
-                        log(f"资产 {asset_key} 缺少价格数据", "WARN")
-                        continue
-                    
-                    
-                    try:
-                        price_decimal = int(price) / 1e18
-                        price_str = f"{price_decimal:.8f}"
-                    except ValueError:
-                        price_str = price
-                    
-                    
-                    timestamp = timestamped_sig.get('timestamp')
-                    if not timestamp:
-                        log(f"资产 {asset_key} 缺少时间戳", "WARN")
-                        continue
-                    
-                   
-                    log(f"资产 {asset_key} 的原始时间戳数据: {timestamp}", "INFO")
-                    
-                    
-                    try:
-                        
-                        if isinstance(timestamp, str):
-                            timestamp = timestamp.replace('0x', '').strip()
-                            try:
-                                timestamp = int(timestamp, 16)
-                            except ValueError:
-                                timestamp = int(float(timestamp))
-                        else:
-                            timestamp = int(timestamp)
-                        
-                        
-                        log(f"资产 {asset_key} 的转换后时间戳: {timestamp}", "INFO")
-                        
-                        
-                        timestamp_str = str(timestamp)
-                        if len(timestamp_str) > 16:  
-                            timestamp = timestamp // 1000000000
-                        elif len(timestamp_str) > 13: 
-                            timestamp = timestamp // 1000000
-                        elif len(timestamp_str) > 10:  
-                            timestamp = timestamp // 1000
-                        
-                        
-                        iso_time = datetime.fromtimestamp(timestamp).isoformat()
-                        log(f"资产 {asset_key} 的最终ISO时间: {iso_time}", "INFO")
-                        
-                    except (ValueError, OSError) as e:
-                        log(f"处理资产 {asset_key} 的时间戳时出错: {str(e)}", "ERROR")
-                        log(f"错误详情: timestamp={timestamp}, type={type(timestamp)}", "ERROR")
-                        continue
-                    
-                    price_data = {
-                        'asset': asset_key,
-                        'msg_hash': msg_hash,
-                        'price': price_str,
-                        'timestamp': iso_time,
-                        'raw_price': price  
-                    }
-                    
-                    result.append(price_data)
-                    log(f"成功处理资产 {asset_key}: 价格 = {price_str}", "SUCCESS")
-                    
-                except Exception as e:
-                    log(f"处理资产 {asset_key} 时出错: {str(e)}", "ERROR")
-                    continue
+            result = parse_signed_prices(data['data'])
+            if cache_key is not None:
+                response_cache.commit(cache_key, result)
             
-            log(f"总共处理了 {len(result)} 个有效价格数据", "SUCCESS")
+            log("总共处理了 %s 个有效价格数据", "SUCCESS", len(result))
             return result
             
-        except requests.exceptions.RequestException as e:
-            log(f"API请求失败: {str(e)}", "ERROR")
-            if hasattr(e, 'response') and e.response is not None:
-                log(f"错误响应: {e.response.text}", "ERROR")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            log("API请求失败: %s", "ERROR", str(e))
             raise
         except Exception as e:
-            log(f"获取价格数据时发生未知错误: {str(e)}", "ERROR")
+            log("获取价格数据时发生未知错误: %s", "ERROR", str(e))
             raise
     
-    async def send_validation(self, tokens: Dict, msg_hash: str, is_valid: bool, proxy: Optional[str] = None) -> Dict:
+    async def send_validation(self, tokens: Dict, msg_hash: str, is_valid: bool, proxy: Optional[str] = None, deadline: Optional[float] = None) -> Dict:
+       
+        with tracer.span('send_validation') as span:
+            return await self._send_validation(tokens, msg_hash, is_valid, proxy, span, deadline)
+    
+    async def _send_validation(self, tokens: Dict, msg_hash: str, is_valid: bool, proxy: Optional[str], span: Union[Span, NullSpan], deadline: Optional[float] = None) -> Dict:
        
         max_retries = 3
         retry_delay = 1
         
         for attempt in range(max_retries):
+            span.retries = attempt
             try:
-                url = f"{self.base_url}/v1/stork_signed_prices/validations"
-                headers = {
-                    'Authorization': f"Bearer {tokens['accessToken']}",
-                    'Content-Type': 'application/json',
-                    'Origin': self.origin,
-                    'User-Agent': self.user_agent
-                }
                 data = {'msg_hash': msg_hash, 'valid': is_valid}
                 
-                proxies = {'http': proxy, 'https': proxy} if proxy else None
-                
-                response = requests.post(
-                    url,
-                    headers=headers,
-                    json=data,
-                    proxies=proxies,
-                    timeout=30
+                status, _, body = await self._request(
+                    'POST',
+                    '/v1/stork_signed_prices/validations',
+                    'validations',
+                    tokens,
+                    proxy,
+                    json_body=data,
+                    deadline=deadline
                 )
                 
-                try:
-                    response.raise_for_status()
-                    return {'success': True, 'data': response.json()}
-                except requests.exceptions.HTTPError as e:
-                    if e.response.status_code == 401:
-                        log("认证错误 - token可能无效", "ERROR")
-                        raise
-                    elif e.response.status_code == 429:
-                        wait_time = retry_delay * (2 ** attempt)
-                        log(f"请求频率限制 - 等待{wait_time}秒", "WARN")
-                        await asyncio.sleep(wait_time)
-                        continue
-                    else:
-                        log(f"HTTP错误 {e.response.status_code}: {e.response.text}", "ERROR")
-                        raise
+                if status < 400:
+                    return {'success': True, 'data': json.loads(body) if body else {}}
+                
+                if status == 401:
+                    log("认证错误 - token可能无效", "ERROR")
+                    raise Exception(f"认证失败: HTTP {status}")
+                elif status == 429:
+                    log("请求频率限制 - 第%s次，由限速器控制重试时间", "WARN", attempt+1)
+                    continue
+                else:
+                    log("HTTP错误 %s: %s", "ERROR", status, body.decode('utf-8', errors='replace'))
+                    raise Exception(f"HTTP错误 {status}")
                     
-            except requests.exceptions.ConnectionError:
+            except DeadlineExceeded as e:
+                log("放弃提交 %s: %s", "DEBUG", msg_hash, str(e))
+                return self._expired(span)
+            except aiohttp.ClientConnectionError:
                 log("连接错误 - 检查网络或代理设置", "ERROR")
                 if attempt < max_retries - 1:
-                    await asyncio.sleep(retry_delay * (2 ** attempt))
-                    continue
+                    if await self._backoff(retry_delay * (2 ** attempt), deadline):
+                        continue
+                    return self._expired(span)
                 raise
-            except requests.exceptions.Timeout:
+            except asyncio.TimeoutError:
+                if deadline is not None and deadline <= time.time():
+                    return self._expired(span)
                 log("请求超时", "ERROR")
                 if attempt < max_retries - 1:
-                    await asyncio.sleep(retry_delay * (2 ** attempt))
-                    continue
+                    if await self._backoff(retry_delay * (2 ** attempt), deadline):
+                        continue
+                    return self._expired(span)
                 raise
             except Exception as e:
-                log(f"验证请求错误: {str(e)}", "ERROR")
+                log("验证请求错误: %s", "ERROR", str(e))
                 raise
         
+        span.status = 'exhausted'
         return {'success': False, 'error': '达到最大重试次数'}
     
-    async def get_user_stats(self, tokens: Dict) -> Dict:
+    @staticmethod
+    async def _backoff(delay: float, deadline: Optional[float]) -> bool:
+        
+        if deadline is not None and time.time() + delay >= deadline:
+            return False
+        await asyncio.sleep(delay)
+        return True
+    
+    @staticmethod
+    def _expired(span: Union[Span, NullSpan]) -> Dict:
+        
+        span.status = 'expired'
+        return {'success': False, 'expired': True, 'error': '价格已过新鲜期'}
+    
+    async def get_user_stats(self, tokens: Dict, strict: bool = False, gate: Optional[asyncio.Event] = None) -> Dict:
        
         log('🔄 获取用户统计数据...')
         
         
-        proxy_config = self._get_proxy_config()
-        if proxy_config:
-            log(f'🌐 使用代理获取用户统计: {proxy_config["http"]}')
+        proxy = self._get_proxy_config()
+        if proxy:
+            log('🌐 使用代理获取用户统计: %s', "INFO", proxy)
         
         
         max_retries = 5
         retry_delay = 3
         last_error = None
+        cache_key = self._cache_key('me', tokens)
         
         for attempt in range(max_retries):
+            if gate is not None:
+                await gate.wait()
             try:
-             
-                timeout = 30  
+              
+                log("Request URL: %s/v1/me", "DEBUG", self.base_url)
+                log("Request Method: GET", "DEBUG")
                 
+               
+                status, _, body = await self._request('GET', '/v1/me', 'me', tokens, proxy, cache_key=cache_key)
                 
-                url = 'https://app-api.jp.stork-oracle.network/v1/me'
-                headers = {
-                    'Authorization': f"Bearer {tokens['accessToken']}",
-                    'Content-Type': 'application/json',
-                    'Origin': 'chrome-extension://knnliglhgkmlblppdejchidfihjnockl',
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/133.0.0.0 Safari/537.36'
-                }
+                log('📥 收到用户统计响应状态码: %s', "INFO", status)
                 
-              
-                log(f"Request URL: {url}", "DEBUG")
-                log(f"Request Method: GET", "DEBUG")
-                log(f"Request Headers: {headers}", "DEBUG")
+                if status == 304:
+                    log('✅ 用户统计未变化（304），复用上次的数据')
+                    return response_cache.cached(cache_key)
                 
-               
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(
-                        url,
-                        headers=headers,
-                        proxy=proxy_config.get('http') if proxy_config else None,
-                        timeout=timeout,
-                        ssl=False 
-                    ) as response:
-                      
-                        log(f'📥 收到用户统计响应状态码: {response.status}')
+                if status == 200:
+                   
+                    log('✅ 成功获取用户统计数据')
+                    response_data = json.loads(body)
+                    
+                  
+                    log("完整响应数据: %s", "DEBUG", LazyValue(lambda: json.dumps(response_data, ensure_ascii=False)))
+                    
+                   
+                    data = None
+                    if 'data' in response_data:
+                   
+                        data = response_data['data']
+                    else:
+                       
+                        data = response_data
+                    
+                    
+                    if not data:
+                        raise Exception("API返回的数据为空")
+                    
+                   
+                    user_info = {}
+                    
+                    
+                    if isinstance(data, dict):
+                       
+                        if 'id' in data:
+                            user_info['userId'] = data['id']
+                            log("从API响应中提取用户ID: %s", "INFO", user_info['userId'])
+                        
+                       
+                        if 'referral_code' in data:
+                            user_info['referralCode'] = data['referral_code']
+                            log("从API响应中提取推荐码: %s", "INFO", user_info['referralCode'])
+                        elif 'referralCode' in data:
+                            user_info['referralCode'] = data['referralCode']
+                            log("从API响应中提取推荐码: %s", "INFO", user_info['referralCode'])
                         
-                        if response.status == 200:
-                           
-                            log('✅ 成功获取用户统计数据')
-                            response_data = await response.json()
-                            
-                          
-                            log(f"完整响应数据: {json.dumps(response_data, ensure_ascii=False)}", "DEBUG")
-                            
-                           
-                            data = None
-                            if 'data' in response_data:
-                           
-                                data = response_data['data']
-                            else:
-                               
-                                data = response_data
-                            
-                            
-                            if not data:
-                                raise Exception("API返回的数据为空")
-                            
-                           
-                            user_info = {}
-                            
-                            
-                            if isinstance(data, dict):
+                      
+                        if 'email' in data:
+                            user_info['email'] = data['email']
+                            log("从API响应中提取邮箱: %s", "INFO", user_info['email'])
+                    
+                    
+                    if 'userId' not in user_info or 'referralCode' not in user_info:
+                        try:
+                            id_token = tokens.get('idToken', '')
+                            if id_token:
                                
-                                if 'id' in data:
-                                    user_info['userId'] = data['id']
-                                    log(f"从API响应中提取用户ID: {user_info['userId']}", "INFO")
+                                log("尝试从ID token解析用户信息，token长度: %s", "DEBUG", len(id_token))
                                 
-                               
-                                if 'referral_code' in data:
-                                    user_info['referralCode'] = data['referral_code']
-                                    log(f"从API响应中提取推荐码: {user_info['referralCode']}", "INFO")
-                                elif 'referralCode' in data:
-                                    user_info['referralCode'] = data['referralCode']
-                                    log(f"从API响应中提取推荐码: {user_info['referralCode']}", "INFO")
                                 
-                              
-                                if 'email' in data:
-                                    user_info['email'] = data['email']
-                                    log(f"从API响应中提取邮箱: {user_info['email']}", "INFO")
-                            
-                            
-                            if 'userId' not in user_info or 'referralCode' not in user_info:
-                                try:
-                                    id_token = tokens.get('idToken', '')
-                                    if id_token:
+                                token_parts = id_token.split('.')
+                                if len(token_parts) == 3:
+                                 
+                                    payload = token_parts[1]
+                                  
+                                    payload += '=' * ((4 - len(payload) % 4) % 4)
+                                    
+                                    try:
                                        
-                                        log(f"尝试从ID token解析用户信息，token长度: {len(id_token)}", "DEBUG")
+                                        decoded_payload = base64.b64decode(payload)
+                                        token_data = json.loads(decoded_payload.decode('utf-8', errors='ignore'))
                                         
+                                  
+                                        log("成功解码token payload，包含字段: %s", "DEBUG", list(token_data.keys()))
                                         
-                                        token_parts = id_token.split('.')
-                                        if len(token_parts) == 3:
-                                         
-                                            payload = token_parts[1]
-                                          
-                                            payload += '=' * ((4 - len(payload) % 4) % 4)
-                                            
-                                            try:
-                                               
-                                                decoded_payload = base64.b64decode(payload)
-                                                token_data = json.loads(decoded_payload.decode('utf-8', errors='ignore'))
-                                                
-                                          
-                                                log(f"成功解码token payload，包含字段: {list(token_data.keys())}", "DEBUG")
-                                                
-                                               
-                                                if 'userId' not in user_info and 'sub' in token_data:
-                                                    user_info['userId'] = token_data['sub']
-                                                    log(f"从ID token中提取用户ID: {user_info['userId']}", "INFO")
-                                                
-                                                if 'referralCode' not in user_info:
-                                                
-                                                    for field in ['custom:referral_code', 'referral_code', 'referralCode']:
-                                                        if field in token_data and token_data[field]:
-                                                            user_info['referralCode'] = token_data[field]
-                                                            log(f"从ID token中提取推荐码: {user_info['referralCode']}", "INFO")
-                                                            break
-                                                
-                                                if 'email' not in user_info and 'email' in token_data:
-                                                    user_info['email'] = token_data['email']
-                                                    log(f"从ID token中提取邮箱: {user_info['email']}", "INFO")
-                                            except Exception as e:
-                                                log(f"解析token payload失败: {str(e)}", "WARN")
-                                except Exception as e:
-                                    log(f"解析ID token失败: {str(e)}", "WARN")
-                            
-                           
-                            user_data = {
-                                "username": user_info.get("email", data.get("email", "未知")),
-                                "userId": user_info.get("userId", data.get("userId", data.get("id", "未知"))),
-                                "referralCode": user_info.get("referralCode", data.get("referralCode", data.get("referral_code", "未知"))),
-                                "validations": data.get("validations", [])
-                            }
-                            
-                           
-                            if "stats" in data:
-                                user_data["stats"] = data["stats"]
-                            elif "validations" in data:
-                               
-                                valid_count = 0
-                                invalid_count = 0
-                                for validation in data["validations"]:
-                                    if validation.get("valid", False):
-                                        valid_count += 1
-                                    else:
-                                        invalid_count += 1
-                                
-                                user_data["stats"] = {
-                                    "valid": valid_count,
-                                    "invalid": invalid_count,
-                                    "total": valid_count + invalid_count,
-                                    "lastCheck": data.get("lastCheck", "")
-                                }
+                                       
+                                        if 'userId' not in user_info and 'sub' in token_data:
+                                            user_info['userId'] = token_data['sub']
+                                            log("从ID token中提取用户ID: %s", "INFO", user_info['userId'])
+                                        
+                                        if 'referralCode' not in user_info:
+                                        
+                                            for field in ['custom:referral_code', 'referral_code', 'referralCode']:
+                                                if field in token_data and token_data[field]:
+                                                    user_info['referralCode'] = token_data[field]
+                                                    log("从ID token中提取推荐码: %s", "INFO", user_info['referralCode'])
+                                                    break
+                                        
+                                        if 'email' not in user_info and 'email' in token_data:
+                                            user_info['email'] = token_data['email']
+                                            log("从ID token中提取邮箱: %s", "INFO", user_info['email'])
+                                    except Exception as e:
+                                        log("解析token payload失败: %s", "WARN", str(e))
+                        except Exception as e:
+                            log("解析ID token失败: %s", "WARN", str(e))
+                    
+                   
+                    user_data = {
+                        "username": user_info.get("email", data.get("email", "未知")),
+                        "userId": user_info.get("userId", data.get("userId", data.get("id", "未知"))),
+                        "referralCode": user_info.get("referralCode", data.get("referralCode", data.get("referral_code", "未知"))),
+                        "validations": data.get("validations", [])
+                    }
+                    
+                   
+                    if "stats" in data:
+                        user_data["stats"] = data["stats"]
+                    elif "validations" in data:
+                       
+                        valid_count = 0
+                        invalid_count = 0
+                        for validation in data["validations"]:
+                            if validation.get("valid", False):
+                                valid_count += 1
                             else:
-                               
-                                user_data["stats"] = {
-                                    "valid": 0,
-                                    "invalid": 0,
-                                    "total": 0,
-                                    "lastCheck": ""
-                                }
-                            
-                            log(f"构建的用户数据: {user_data}", "DEBUG")
-                            return user_data
-                        else:
-                           
-                            error_text = await response.text()
-                            log(f'❌ 获取用户统计失败: {response.status} - {error_text}', "ERROR")
-                            
-                         
-                            if response.status == 401:
-                                raise Exception(f"认证失败: {error_text}")
-                            
-                            
-                            if response.status >= 500:
-                                wait_time = retry_delay * (2 ** attempt)
-                                log(f"服务器错误，等待 {wait_time} 秒后重试...", "WARN")
-                                await asyncio.sleep(wait_time)
-                                continue
-                            
-                            raise Exception(f"请求失败: {response.status} - {error_text}")
+                                invalid_count += 1
+                        
+                        user_data["stats"] = {
+                            "valid": valid_count,
+                            "invalid": invalid_count,
+                            "total": valid_count + invalid_count,
+                            "lastCheck": data.get("lastCheck", "")
+                        }
+                    else:
+                       
+                        user_data["stats"] = {
+                            "valid": 0,
+                            "invalid": 0,
+                            "total": 0,
+                            "lastCheck": ""
+                        }
+                    
+                    log("构建的用户数据: %s", "DEBUG", user_data)
+                    if cache_key is not None:
+                        response_cache.commit(cache_key, user_data)
+                    return user_data
+                else:
+                   
+                    error_text = body.decode('utf-8', errors='replace')
+                    log('❌ 获取用户统计失败: %s - %s', "ERROR", status, error_text)
+                    
+                 
+                    if status == 401:
+                        raise Exception(f"认证失败: {error_text}")
+                    
+                    
+                    if status >= 500:
+                        last_error = Exception(f"HTTP {status}")
+                        wait_time = retry_delay * (2 ** attempt)
+                        log("服务器错误，等待 %s 秒后重试...", "WARN", wait_time)
+                        await asyncio.sleep(wait_time)
+                        continue
+                    
+                    raise Exception(f"请求失败: {status} - {error_text}")
             
             except aiohttp.ClientConnectorError as e:
                 
-                log(f"连接错误: {str(e)}", "ERROR")
+                log("连接错误: %s", "ERROR", str(e))
                 last_error = e
                 wait_time = retry_delay * (2 ** attempt)
-                log(f"连接错误，等待 {wait_time} 秒后重试...", "WARN")
+                log("连接错误，等待 %s 秒后重试...", "WARN", wait_time)
                 await asyncio.sleep(wait_time)
                 
             except aiohttp.ClientSSLError as e:
               
-                log(f"SSL错误: {str(e)}", "ERROR")
+                log("SSL错误: %s", "ERROR", str(e))
                 last_error = e
                 wait_time = retry_delay * (2 ** attempt)
-                log(f"SSL错误，等待 {wait_time} 秒后重试，尝试禁用SSL验证...", "WARN")
+                log("SSL错误，等待 %s 秒后重试，尝试禁用SSL验证...", "WARN", wait_time)
                 await asyncio.sleep(wait_time)
                 
             except aiohttp.ClientError as e:
                
-                log(f"客户端错误: {str(e)}", "ERROR")
+                log("客户端错误: %s", "ERROR", str(e))
                 last_error = e
                 wait_time = retry_delay * (2 ** attempt)
-                log(f"客户端错误，等待 {wait_time} 秒后重试...", "WARN")
+                log("客户端错误，等待 %s 秒后重试...", "WARN", wait_time)
                 await asyncio.sleep(wait_time)
                 
             except asyncio.TimeoutError:
@@ -1208,12 +2414,12 @@ class StorkAPI:
                 log("请求超时", "ERROR")
                 last_error = Exception("请求超时")
                 wait_time = retry_delay * (2 ** attempt)
-                log(f"请求超时，等待 {wait_time} 秒后重试...", "WARN")
+                log("请求超时，等待 %s 秒后重试...", "WARN", wait_time)
                 await asyncio.sleep(wait_time)
                 
             except Exception as e:
               
-                log(f"❌ 获取用户统计失败: {str(e)}", "ERROR")
+                log("❌ 获取用户统计失败: %s", "ERROR", str(e))
                 last_error = e
                 
                
@@ -1221,10 +2427,12 @@ class StorkAPI:
                     raise
                 
                 wait_time = retry_delay * (2 ** attempt)
-                log(f"未知错误，等待 {wait_time} 秒后重试...", "WARN")
+                log("未知错误，等待 %s 秒后重试...", "WARN", wait_time)
                 await asyncio.sleep(wait_time)
         
       
+        if strict:
+            raise Exception(f"所有重试都失败: {last_error}")
         log("所有重试都失败，返回默认用户数据", "WARN")
         
       
@@ -1249,9 +2457,9 @@ class StorkAPI:
                         "userId": token_data.get("sub", "未知"),
                         "referralCode": token_data.get("custom:referral_code", "未知")
                     }
-                    log(f"从ID token中提取的用户信息: {user_info}", "DEBUG")
+                    log("从ID token中提取的用户信息: %s", "DEBUG", user_info)
         except Exception as e:
-            log(f"解析ID token失败: {str(e)}", "WARN")
+            log("解析ID token失败: %s", "WARN", str(e))
         
       
         default_user_data = {
@@ -1270,70 +2478,785 @@ class StorkAPI:
         return default_user_data
 
 
-def validate_price(price_data: Dict) -> bool:
+class ReplayStorkAPI(StorkAPI):
+    
+    
+    def __init__(self, config: Dict, fixtures: Dict[str, List[Tuple[int, Dict, bytes]]]):
+        super().__init__(config, [])
+        self.fixtures = fixtures
+        self.positions: Dict[str, int] = {}
+    
+    async def _request(self, method: str, path: str, endpoint: str, tokens: Dict, proxy: Optional[str] = None, json_body: Optional[Dict] = None, deadline: Optional[float] = None, cache_key: Optional[Tuple[str, str]] = None) -> Tuple[int, Any, bytes]:
+        
+        if deadline is not None and deadline <= time.time():
+            raise DeadlineExceeded(f"{endpoint} 请求已超过截止时间")
+        responses = self.fixtures.get(endpoint)
+        if not responses:
+            raise Exception(f"录制文件中没有 {endpoint} 的响应")
+        
+        index = self.positions.get(endpoint, 0)
+        self.positions[endpoint] = index + 1
+        status, headers, body = responses[index % len(responses)]
+        if cache_key is not None and status == 200:
+            response_cache.remember(cache_key, headers)
+        return status, headers, body
+    
+    async def _stream_chunks(self, method: str, path: str, endpoint: str, tokens: Dict, proxy: Optional[str] = None, cache_key: Optional[Tuple[str, str]] = None):
+        
+        status, _, body = await self._request(method, path, endpoint, tokens, proxy, cache_key=cache_key)
+        if status >= 400:
+            raise Exception(f"API请求失败: HTTP {status}")
+        if status == 304:
+            raise NotModified(endpoint)
+        for offset in range(0, len(body), STREAM_CHUNK_SIZE):
+            yield body[offset:offset + STREAM_CHUNK_SIZE]
+
+
+class ValidatedHashIndex:
+    
+    
+    def __init__(self, path: str, ttl_seconds: float = PRICE_FRESHNESS_SECONDS + 330, compact_threshold: int = 5000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.compact_threshold = compact_threshold
+        self.entries: Dict[str, OrderedDict] = {}
+        self.pending: List[Tuple[str, str, float]] = []
+        self.file_lines = 0
+        self.loaded = False
+    
+    def configure(self, config: Dict) -> None:
+        
+        interval = config.get('stork', {}).get('intervalSeconds', 300) + 30
+        max_poll = config.get('polling', {}).get('maxSeconds', 600)
+        self.ttl_seconds = max(interval, max_poll) + PRICE_FRESHNESS_SECONDS
+    
+    def _prune(self, username: str, now: float) -> OrderedDict:
+        
+        hashes = self.entries.setdefault(username, OrderedDict())
+        while hashes:
+            msg_hash, submitted_at = next(iter(hashes.items()))
+            if now - submitted_at < self.ttl_seconds:
+                break
+            hashes.popitem(last=False)
+        return hashes
+    
+    def load(self) -> None:
+        
+        if self.loaded:
+            return
+        self.loaded = True
+        
+        if not os.path.exists(self.path):
+            return
+        
+        now = time.time()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        username, msg_hash, submitted_at = json.loads(line)
+                    except (ValueError, TypeError):
+                        continue
+                    if now - submitted_at < self.ttl_seconds:
+                        hashes = self.entries.setdefault(username, OrderedDict())
+                        hashes.pop(msg_hash, None)
+                        hashes[msg_hash] = submitted_at
+            
+            self._compact()
+            log("已加载 %s 条未过期的已验证记录", "INFO", self.file_lines)
+        except Exception as e:
+            log("加载已验证记录失败: %s", "WARN", str(e))
+    
+    def _compact(self) -> None:
+        
+        now = time.time()
+        tmp_path = f"{self.path}.tmp"
+        lines = 0
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for username in list(self.entries):
+                for msg_hash, submitted_at in self._prune(username, now).items():
+                    f.write(json.dumps([username, msg_hash, submitted_at]) + '\n')
+                    lines += 1
+        os.replace(tmp_path, self.path)
+        self.file_lines = lines
+    
+    def contains(self, username: str, msg_hash: str) -> bool:
+        
+        self.load()
+        return msg_hash in self._prune(username, time.time())
+    
+    def add(self, username: str, msg_hash: str) -> None:
+        
+        self.load()
+        now = time.time()
+        hashes = self._prune(username, now)
+        hashes.pop(msg_hash, None)
+        hashes[msg_hash] = now
+        self.pending.append((username, msg_hash, now))
+    
+    def flush(self) -> None:
+        
+        if not self.pending:
+            return
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(''.join(json.dumps(list(entry)) + '\n' for entry in self.pending))
+            self.file_lines += len(self.pending)
+            self.pending.clear()
+        except Exception as e:
+            log("保存已验证记录失败: %s", "ERROR", str(e))
+            return
+        
+        live = sum(len(hashes) for hashes in self.entries.values())
+        if self.file_lines >= self.compact_threshold and self.file_lines > 2 * live:
+            try:
+                self._compact()
+                log("已压缩已验证记录文件，保留 %s 条", "DEBUG", self.file_lines)
+            except Exception as e:
+                log("压缩已验证记录文件失败: %s", "ERROR", str(e))
+
+
+validated_hashes = ValidatedHashIndex(VALIDATED_HASHES_PATH)
+
+
+def validate_price(price: PriceRecord) -> bool:
   
    try:
-       log(f"Validating data for {price_data.get('asset', 'unknown asset')}")
+       log("Validating data for %s", "DEBUG", price.asset)
        
-       if not price_data.get('msg_hash') or not price_data.get('price') or not price_data.get('timestamp'):
+       if not price.msg_hash or not price.raw_price or not price.timestamp_ns:
            log('Incomplete data, considered invalid', "WARN")
            return False
        
-       current_time = time.time()
-       data_time = datetime.fromisoformat(price_data['timestamp']).timestamp()
-       time_diff_seconds = abs(current_time - data_time)
+       time_diff_seconds = abs(time.time_ns() - price.timestamp_ns) / 1e9
        
       
-       if time_diff_seconds > 300: 
-           log(f"数据时间差为 {round(time_diff_seconds)}秒，超过5分钟窗口", "WARN")
+       if time_diff_seconds > PRICE_FRESHNESS_SECONDS: 
+           log("数据时间差为 %s秒，超过5分钟窗口", "WARN", round(time_diff_seconds))
            return False
        
-       log(f"数据时间差为 {round(time_diff_seconds)}秒，在有效范围内", "SUCCESS")
+       log("数据时间差为 %s秒，在有效范围内", "DEBUG", round(time_diff_seconds))
        return True
    except Exception as e:
-       log(f"Validation error: {str(e)}", "ERROR")
+       log("Validation error: %s", "ERROR", str(e))
        return False
 
 
-class ValidationWorker:
-   
-   
-   def __init__(self, price_data: Dict, tokens: Dict, proxy: Optional[str], config: Dict):
-       self.price_data = price_data
-       self.tokens = tokens
-       self.proxy = proxy
-       self.config = config
-   
-   async def validate_and_send(self) -> Dict:
-    
-       try:
-           stork_api = StorkAPI(self.config)
-           is_valid = validate_price(self.price_data)
-           
-           
-           asset_name = self.price_data.get('asset', 'unknown')
-           log(f"Validating {asset_name} price: {self.price_data.get('price', 'N/A')}")
-           
-           result = await stork_api.send_validation(self.tokens, self.price_data['msg_hash'], is_valid, self.proxy)
-           
-         
-           status = "✅ valid" if is_valid else "❌ invalid"
-           log(f"Price validation for {asset_name}: {status}")
-           
-           return {
-               'success': True,
-               'msg_hash': self.price_data['msg_hash'],
-               'is_valid': is_valid,
-               'asset': asset_name
-           }
-       except Exception as e:
-           log(f"Validation error for {self.price_data.get('asset', 'unknown')}: {str(e)}", "ERROR")
-           return {
-               'success': False,
-               'error': str(e),
-               'msg_hash': self.price_data['msg_hash'],
-               'asset': self.price_data.get('asset', 'unknown')
-           }
+def validate_prices(batch: PriceBatch, now_ns: Optional[int] = None) -> List[bool]:
+    
+    if not len(batch):
+        return []
+    
+    now_ns = now_ns or time.time_ns()
+    window_ns = PRICE_FRESHNESS_SECONDS * 1000000000
+    
+    if np is not None:
+        timestamps = np.frombuffer(batch.timestamps_ns, dtype=np.int64)
+        values = np.frombuffer(batch.prices, dtype=np.float64)
+        
+        missing = (timestamps == 0) | (values == 0)
+        stale = ~missing & (np.abs(timestamps - now_ns) > window_ns)
+        insane = ~missing & ~stale & (~np.isfinite(values) | (values < 0))
+        verdicts = (~(missing | stale | insane)).tolist()
+        missing_count, stale_count, insane_count = int(missing.sum()), int(stale.sum()), int(insane.sum())
+    else:
+        verdicts = []
+        missing_count = stale_count = insane_count = 0
+        infinity = float('inf')
+        for timestamp_ns, value in zip(batch.timestamps_ns, batch.prices):
+            if not timestamp_ns or not value:
+                missing_count += 1
+                verdicts.append(False)
+            elif abs(now_ns - timestamp_ns) > window_ns:
+                stale_count += 1
+                verdicts.append(False)
+            elif not 0 < value < infinity:
+                insane_count += 1
+                verdicts.append(False)
+            else:
+                verdicts.append(True)
+    
+    log("批量校验 %s 个价格: 有效 %s，过期 %s，缺少字段 %s，数值异常 %s", "DEBUG",
+        len(batch), len(batch) - missing_count - stale_count - insane_count, stale_count, missing_count, insane_count)
+    return verdicts
+
+
+class SignatureVerifier:
+    
+    
+    def __init__(self):
+        self.enabled = False
+        self.publishers: Set[str] = set()
+        self.prefixed = True
+        self.timestamp_unit = 'seconds'
+        self.workers = 0
+        self.cache_size = 50000
+        self.cache: OrderedDict = OrderedDict()
+        self.pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+    
+    def configure(self, config: Dict) -> None:
+        
+        signature_config = config.get('signatures', {})
+        if not signature_config.get('enabled', False):
+            return
+        
+        if not stork_crypto.available():
+            log("签名校验需要安装 coincurve 和 pycryptodome（pip install coincurve pycryptodome），跳过签名校验", "ERROR")
+            return
+        
+        self.publishers = {address.lower() for address in signature_config.get('publishers', [])}
+        if not self.publishers:
+            log("已开启签名校验，但没有配置 signatures.publishers，跳过签名校验", "WARN")
+            return
+        
+        self.timestamp_unit = signature_config.get('timestampUnit', 'seconds')
+        if self.timestamp_unit not in stork_crypto.TIMESTAMP_DIVISORS:
+            log("未知的 signatures.timestampUnit %s，可选: %s", "ERROR", self.timestamp_unit, ', '.join(stork_crypto.TIMESTAMP_DIVISORS))
+            return
+        
+        self.prefixed = signature_config.get('ethSignedMessage', True)
+        self.workers = signature_config.get('workers', 2)
+        self.cache_size = signature_config.get('cacheSize', 50000)
+        self.enabled = True
+        log("签名校验已开启，发布者地址 %s 个，线程数 %s", "INFO", len(self.publishers), self.workers)
+    
+    def _remember(self, msg_hash: bytes, signature: Any, signer: Optional[str]) -> None:
+        
+        self.cache[msg_hash] = (signature, signer)
+        self.cache.move_to_end(msg_hash)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+    
+    def _matches_payload(self, price: PriceRecord, signer: Optional[str]) -> bool:
+        
+        if signer is None or signer not in self.publishers:
+            return False
+        try:
+            expected = stork_crypto.stork_message_hash(signer, price.asset, price.timestamp_ns, price.raw_price, self.timestamp_unit)
+        except (ValueError, OverflowError):
+            return False
+        return expected == price.msg_hash
+    
+    async def verify_batch(self, prices: Union[PriceBatch, List[PriceRecord]]) -> List[bool]:
+        
+        signers: List[Optional[str]] = []
+        pending: List[Tuple[int, bytes, Any]] = []
+        for index, price in enumerate(prices):
+            cached = self.cache.get(price.msg_hash)
+            if cached is not None and cached[0] == price.signature:
+                signers.append(cached[1])
+                continue
+            signers.append(None)
+            pending.append((index, price.msg_hash, price.signature))
+        
+        SIGNATURE_CHECKS_TOTAL.inc('cached', amount=len(signers) - len(pending))
+        if pending:
+            loop = asyncio.get_running_loop()
+            items = [(msg_hash, signature) for _, msg_hash, signature in pending]
+            if self.workers > 0:
+                if self.pool is None:
+                    self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='signature')
+                chunk_size = max(1, -(-len(items) // self.workers))
+                chunks = [items[start:start + chunk_size] for start in range(0, len(items), chunk_size)]
+                results = await asyncio.gather(*(loop.run_in_executor(self.pool, stork_crypto.recover_signers, chunk, self.prefixed) for chunk in chunks))
+                recovered = [signer for chunk in results for signer in chunk]
+            else:
+                recovered = await loop.run_in_executor(None, stork_crypto.recover_signers, items, self.prefixed)
+            
+            for (index, msg_hash, signature), signer in zip(pending, recovered):
+                signers[index] = signer
+                self._remember(msg_hash, signature, signer)
+        
+        verdicts = [self._matches_payload(price, signer) for price, signer in zip(prices, signers)]
+        rejected = verdicts.count(False)
+        SIGNATURE_CHECKS_TOTAL.inc('verified', amount=len(verdicts) - rejected)
+        SIGNATURE_CHECKS_TOTAL.inc('rejected', amount=rejected)
+        if rejected:
+            log("%s/%s 个价格的签名不是来自已配置的发布者，或与资产/价格/时间戳不符", "WARN", rejected, len(verdicts))
+        return verdicts
+    
+    def close(self) -> None:
+        
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+
+signature_verifier = SignatureVerifier()
+
+
+def _median_sorted(values: List[float]) -> float:
+    
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+
+class PriceHistory:
+    
+    
+    MAGIC = b'STKHIST1'
+    HEADER = struct.Struct('<8sII')
+    NAME_BYTES = 48
+    SLOT_HEADER = struct.Struct(f'<{NAME_BYTES}sII')
+    
+    def __init__(self, path: str, capacity: int = 64, max_assets: int = 2048):
+        self.path = path
+        self.capacity = capacity
+        self.max_assets = max_assets
+        self.slot_size = self.SLOT_HEADER.size + capacity * 16
+        self.slots: Dict[bytes, int] = {}
+        self.file = None
+        self.buffer: Optional[mmap.mmap] = None
+        self.rule: Optional[Any] = None
+        self.enabled = False
+    
+    def configure(self, config: Dict) -> None:
+        
+        history_config = config.get('history', {})
+        if not history_config.get('enabled', False) or self.enabled:
+            return
+        
+        rule_name = history_config.get('rule', 'mad')
+        if rule_name not in PRICE_RULES:
+            log("未知的价格历史规则 %s，可选: %s", "ERROR", rule_name, ', '.join(PRICE_RULES))
+            return
+        
+        self.path = history_config.get('path', self.path)
+        self.capacity = history_config.get('capacity', 64)
+        self.max_assets = history_config.get('maxAssets', 2048)
+        self.slot_size = self.SLOT_HEADER.size + self.capacity * 16
+        self.rule = PRICE_RULES[rule_name](history_config)
+        self.open()
+        self.enabled = True
+        log("价格历史校验已开启，规则 %s，已恢复 %s 个资产的历史", "INFO", rule_name, len(self.slots))
+    
+    def open(self) -> None:
+        
+        size = self.HEADER.size + self.max_assets * self.slot_size
+        exists = os.path.exists(self.path) and os.path.getsize(self.path) == size
+        self.file = open(self.path, 'r+b' if exists else 'w+b')
+        if not exists:
+            self.file.truncate(size)
+        self.buffer = mmap.mmap(self.file.fileno(), size)
+        
+        if self.HEADER.unpack_from(self.buffer, 0) != (self.MAGIC, self.capacity, self.max_assets):
+            if exists:
+                log("价格历史文件 %s 格式不匹配，重新初始化", "WARN", self.path)
+            self.buffer[:] = bytes(size)
+            self.HEADER.pack_into(self.buffer, 0, self.MAGIC, self.capacity, self.max_assets)
+        
+        self.slots = {}
+        for index in range(self.max_assets):
+            name = self.SLOT_HEADER.unpack_from(self.buffer, self._slot_offset(index))[0].rstrip(b'\0')
+            if not name:
+                break
+            self.slots[name] = index
+    
+    def _slot_offset(self, index: int) -> int:
+        
+        return self.HEADER.size + index * self.slot_size
+    
+    def _slot_key(self, asset: str) -> bytes:
+        
+        name = asset.encode('utf-8')
+        if len(name) <= self.NAME_BYTES:
+            return name
+        return b'#' + hashlib.sha256(name).hexdigest()[:self.NAME_BYTES - 1].encode('ascii')
+    
+    def append(self, asset: str, timestamp_ns: int, price: float) -> None:
+        
+        key = self._slot_key(asset)
+        index = self.slots.get(key)
+        if index is None:
+            if len(self.slots) >= self.max_assets:
+                return
+            index = self.slots[key] = len(self.slots)
+            self.SLOT_HEADER.pack_into(self.buffer, self._slot_offset(index), key, 0, 0)
+        
+        offset = self._slot_offset(index)
+        name, head, count = self.SLOT_HEADER.unpack_from(self.buffer, offset)
+        timestamps_offset = offset + self.SLOT_HEADER.size
+        prices_offset = timestamps_offset + 8 * self.capacity
+        
+        if count and struct.unpack_from('<q', self.buffer, timestamps_offset + 8 * ((head - 1) % self.capacity))[0] == timestamp_ns:
+            return
+        
+        struct.pack_into('<q', self.buffer, timestamps_offset + 8 * head, timestamp_ns)
+        struct.pack_into('<d', self.buffer, prices_offset + 8 * head, price)
+        self.SLOT_HEADER.pack_into(self.buffer, offset, name, (head + 1) % self.capacity, min(count + 1, self.capacity))
+    
+    def prices(self, asset: str) -> Tuple[float, ...]:
+        
+        index = self.slots.get(self._slot_key(asset))
+        if index is None:
+            return ()
+        offset = self._slot_offset(index)
+        count = self.SLOT_HEADER.unpack_from(self.buffer, offset)[2]
+        return struct.unpack_from(f'<{count}d', self.buffer, offset + self.SLOT_HEADER.size + 8 * self.capacity)
+    
+    def median_mad(self, asset: str) -> Optional[Tuple[float, float, int]]:
+        
+        values = sorted(self.prices(asset))
+        if not values:
+            return None
+        median = _median_sorted(values)
+        return median, _median_sorted(sorted(abs(value - median) for value in values)), len(values)
+    
+    def check(self, prices: PriceBatch, verdicts: List[bool]) -> List[bool]:
+        
+        plausible = [self.rule(price, self) for price in prices]
+        for price, accepted in zip(prices, verdicts):
+            if accepted:
+                self.append(price.asset, price.timestamp_ns, price.price)
+        
+        rejected = plausible.count(False)
+        if rejected:
+            log("%s 个价格与近期历史偏离过大", "WARN", rejected)
+        return plausible
+    
+    def close(self) -> None:
+        
+        if self.buffer is not None:
+            self.buffer.flush()
+            self.buffer.close()
+            self.file.close()
+            self.buffer = None
+            self.file = None
+        self.enabled = False
+
+
+class MadDeviationRule:
+    
+    
+    def __init__(self, config: Dict):
+        self.min_samples = config.get('minSamples', 8)
+        self.max_deviation = config.get('maxDeviation', 10.0)
+        self.min_relative = config.get('minRelativeTolerance', 0.001)
+    
+    def __call__(self, price: PriceRecord, history: PriceHistory) -> bool:
+        
+        stats = history.median_mad(price.asset)
+        if stats is None or stats[2] < self.min_samples:
+            return True
+        median, mad, _ = stats
+        tolerance = max(self.max_deviation * 1.4826 * mad, self.min_relative * abs(median))
+        return abs(price.price - median) <= tolerance
+
+
+PRICE_RULES: Dict[str, Any] = {
+    'mad': MadDeviationRule
+}
+price_history = PriceHistory(PRICE_HISTORY_PATH)
+
+
+async def judge_prices(prices: PriceBatch) -> List[bool]:
+    
+    verdicts = validate_prices(prices)
+    if signature_verifier.enabled:
+        with tracer.span('verify_signatures', assets=len(prices)):
+            signed = await signature_verifier.verify_batch(prices)
+        verdicts = [fresh and trusted for fresh, trusted in zip(verdicts, signed)]
+    if price_history.enabled:
+        plausible = price_history.check(prices, verdicts)
+        verdicts = [accepted and likely for accepted, likely in zip(verdicts, plausible)]
+    return verdicts
+
+
+def submission_deadline(price: PriceRecord, is_valid: bool) -> float:
+
+    return price.fresh_until if is_valid else float('inf')
+
+
+class ValidationWorker:
+   
+   
+   def __init__(self, price: PriceRecord, is_valid: bool, tokens: Dict, proxy: Optional[str], config: Dict, stork_api: Optional[StorkAPI] = None):
+       self.price = price
+       self.is_valid = is_valid
+       self.tokens = tokens
+       self.proxy = proxy
+       self.config = config
+       self.stork_api = stork_api
+       self.deadline = submission_deadline(price, is_valid)
+       self.margin = config.get('dispatch', {}).get('deadlineMarginSeconds', 0.25)
+   
+   async def validate_and_send(self) -> Dict:
+    
+       msg_hash = self.price.msg_hash_hex
+       deadline = self.deadline - self.margin if self.is_valid else None
+       if deadline is not None and deadline <= time.time():
+           log("%s 价格已过新鲜期，取消提交", "DEBUG", self.price.asset)
+           return {'success': False, 'expired': True, 'error': '价格已过新鲜期', 'msg_hash': msg_hash, 'asset': self.price.asset}
+       
+       try:
+           stork_api = self.stork_api or StorkAPI(self.config)
+           is_valid = self.is_valid
+           
+           
+           log("Validating %s price: %s", "DEBUG", self.price.asset, LazyValue(lambda: f"{self.price.price:.8f}"))
+           
+           result = await stork_api.send_validation(self.tokens, msg_hash, is_valid, self.proxy, deadline)
+           if result.get('expired'):
+               log("%s 价格在提交前过期，已取消", "DEBUG", self.price.asset)
+               return dict(result, msg_hash=msg_hash, asset=self.price.asset)
+           if not result.get('success', False):
+               raise Exception(result.get('error', '提交验证失败'))
+           
+         
+           status = "✅ valid" if is_valid else "❌ invalid"
+           log("Price validation for %s: %s", "DEBUG", self.price.asset, status)
+           
+           return {
+               'success': True,
+               'msg_hash': msg_hash,
+               'is_valid': is_valid,
+               'asset': self.price.asset
+           }
+       except Exception as e:
+           log("Validation error for %s: %s", "ERROR", self.price.asset, str(e))
+           return {
+               'success': False,
+               'error': str(e),
+               'msg_hash': msg_hash,
+               'asset': self.price.asset
+           }
+
+
+class ValidationDispatcher:
+   
+   
+   def __init__(self, config: Dict):
+       self.max_in_flight = max(1, config.get('dispatch', {}).get('maxInFlight', 8))
+   
+   async def dispatch(self, workers: List[ValidationWorker]) -> List[Dict]:
+    
+       queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+       for index, worker in enumerate(workers):
+           queue.put_nowait((worker.deadline, index, worker))
+       
+       results: List[Optional[Dict]] = [None] * len(workers)
+       
+       async def consume():
+           while True:
+               try:
+                   _, index, worker = queue.get_nowait()
+               except asyncio.QueueEmpty:
+                   return
+               results[index] = await worker.validate_and_send()
+       
+       consumers = [asyncio.create_task(consume()) for _ in range(min(self.max_in_flight, len(workers)))]
+       try:
+           await asyncio.gather(*consumers)
+       finally:
+           for consumer in consumers:
+               consumer.cancel()
+       
+       return results
+
+
+class ValidationPipeline:
+   
+   
+   def __init__(self, config: Dict, stork_api: StorkAPI, tokens: Dict, username: str, proxies: List[str]):
+       pipeline_config = config.get('pipeline', {})
+       self.queue_size = max(1, pipeline_config.get('queueSize', 256))
+       self.batch_size = max(1, pipeline_config.get('judgeBatchSize', 64))
+       self.max_in_flight = max(1, config.get('dispatch', {}).get('maxInFlight', 8))
+       self.config = config
+       self.stork_api = stork_api
+       self.tokens = tokens
+       self.username = username
+       self.proxies = proxies
+       self.display_prices: Dict[str, PriceRecord] = {}
+       self.fetched = 0
+       self.sequence = 0
+       self.skipped = 0
+       self.error: Optional[Exception] = None
+       self.results: List[Dict] = []
+   
+   async def _fetch(self, decoded: asyncio.Queue) -> None:
+    
+       with tracer.span('get_signed_prices', streamed=True) as span:
+           try:
+               async for price in self.stork_api.stream_signed_prices(self.tokens):
+                   self.fetched += 1
+                   poll_scheduler.observe((price,))
+                   if price.asset in DISPLAY_ASSETS:
+                       self.display_prices[price.asset] = price
+                   if validated_hashes.contains(self.username, price.msg_hash_hex):
+                       self.skipped += 1
+                       continue
+                   await decoded.put(price)
+           except Exception as e:
+               log("流式获取价格数据失败: %s", "ERROR", str(e) or type(e).__name__)
+               self.error = e
+               span.status = 'error'
+           span.attrs['assets'] = self.fetched
+       await decoded.put(None)
+   
+   async def _schedule(self, judged: asyncio.PriorityQueue, price: Optional[PriceRecord], is_valid: bool) -> None:
+    
+       self.sequence += 1
+       deadline = submission_deadline(price, is_valid) if price is not None else float('inf')
+       await judged.put((deadline, self.sequence, price, is_valid))
+   
+   async def _judge(self, decoded: asyncio.Queue, judged: asyncio.PriorityQueue) -> None:
+    
+       done = False
+       while not done:
+           batch = PriceBatch()
+           price = await decoded.get()
+           while price is not None:
+               batch.append(price)
+               if len(batch) >= self.batch_size or decoded.empty():
+                   break
+               price = decoded.get_nowait()
+           done = price is None
+           
+           if len(batch):
+               for price, is_valid in zip(batch, await judge_prices(batch)):
+                   await self._schedule(judged, price, is_valid)
+       
+       for _ in range(self.max_in_flight):
+           await self._schedule(judged, None, False)
+   
+   async def _submit(self, judged: asyncio.PriorityQueue) -> None:
+    
+       while True:
+           _, _, price, is_valid = await judged.get()
+           if price is None:
+               return
+           proxy = random.choice(self.proxies) if self.proxies else None
+           worker = ValidationWorker(price, is_valid, self.tokens, proxy, self.config, self.stork_api)
+           self.results.append(await worker.validate_and_send())
+   
+   async def run(self) -> List[Dict]:
+    
+       decoded: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+       judged: asyncio.PriorityQueue = asyncio.PriorityQueue(maxsize=self.queue_size)
+       tasks = [asyncio.create_task(self._fetch(decoded)), asyncio.create_task(self._judge(decoded, judged))]
+       tasks.extend(asyncio.create_task(self._submit(judged)) for _ in range(self.max_in_flight))
+       try:
+           await asyncio.gather(*tasks)
+       finally:
+           for task in tasks:
+               task.cancel()
+       if self.error is not None or any(not result.get('success') for result in self.results):
+           self.stork_api.forget_streamed_prices(self.tokens)
+       return self.results
+
+
+class AssetCadence:
+    
+    
+    __slots__ = ('msg_hash', 'timestamp_ns', 'cadence', 'unchanged', 'confirmed', 'round')
+    
+    def __init__(self, msg_hash: bytes, timestamp_ns: int, round: int):
+        self.msg_hash = msg_hash
+        self.timestamp_ns = timestamp_ns
+        self.cadence = 0.0
+        self.unchanged = False
+        self.confirmed = False
+        self.round = round
+
+
+class PollScheduler:
+    
+    
+    def __init__(self):
+        self.assets: Dict[str, AssetCadence] = {}
+        self.enabled = False
+        self.min_seconds = 30.0
+        self.max_seconds = 600.0
+        self.smoothing = 0.3
+        self.probe_factor = 0.9
+        self.quantile = 0.5
+        self.guard_seconds = 2.0
+        self.fallback_seconds = 300
+        self.updated = False
+        self.misses = 0
+        self.interval = 0.0
+        self.round = 0
+    
+    def configure(self, config: Dict) -> None:
+        
+        polling_config = config.get('polling', {})
+        self.enabled = polling_config.get('adaptive', False)
+        self.min_seconds = max(1.0, polling_config.get('minSeconds', 30))
+        self.max_seconds = max(self.min_seconds, polling_config.get('maxSeconds', 600))
+        self.smoothing = min(1.0, max(0.01, polling_config.get('smoothing', 0.3)))
+        self.probe_factor = min(1.0, max(0.1, polling_config.get('probeFactor', 0.9)))
+        self.quantile = min(1.0, max(0.0, polling_config.get('quantile', 0.5)))
+        self.guard_seconds = polling_config.get('guardSeconds', 2)
+        self.fallback_seconds = config.get('stork', {}).get('intervalSeconds', 300)
+    
+    def _learn(self, state: AssetCadence, gap: float) -> None:
+        
+        if not state.cadence:
+            state.cadence = gap
+        elif state.unchanged or (state.confirmed and gap < 1.5 * state.cadence):
+            state.cadence += self.smoothing * (gap - state.cadence)
+            state.confirmed = True
+        else:
+            state.cadence = min(state.cadence, gap) * self.probe_factor
+            state.confirmed = False
+    
+    def observe(self, prices: Iterable[PriceRecord]) -> int:
+        
+        fresh = 0
+        for price in prices:
+            state = self.assets.get(price.asset)
+            if state is None:
+                self.assets[price.asset] = AssetCadence(price.msg_hash, price.timestamp_ns, self.round)
+                fresh += 1
+                continue
+            if state.round == self.round:
+                continue
+            state.round = self.round
+            
+            if price.msg_hash == state.msg_hash:
+                state.unchanged = True
+                continue
+            
+            fresh += 1
+            gap = (price.timestamp_ns - state.timestamp_ns) / 1e9
+            if gap > 0:
+                self._learn(state, gap)
+                state.timestamp_ns = price.timestamp_ns
+            state.msg_hash = price.msg_hash
+            state.unchanged = False
+        
+        if fresh:
+            self.updated = True
+        return fresh
+    
+    def next_interval(self, now: Optional[float] = None) -> float:
+        
+        self.round += 1
+        if not self.enabled:
+            self.interval = self.fallback_seconds + random.randint(-30, 30)
+            return self.interval
+        
+        now = time.time() if now is None else now
+        self.misses = 0 if self.updated else self.misses + 1
+        self.updated = False
+        
+        due = sorted(state.timestamp_ns / 1e9 + state.cadence for state in self.assets.values() if state.cadence)
+        if due:
+            delay = due[min(len(due) - 1, int(self.quantile * len(due)))] + self.guard_seconds - now
+        else:
+            delay = self.fallback_seconds
+        if self.misses:
+            delay = max(delay, self.min_seconds * 2 ** (self.misses - 1))
+        
+        self.interval = round(min(self.max_seconds, max(self.min_seconds, delay)), 1)
+        log("下次拉取间隔 %ss（%s 个资产已估计更新周期，连续 %s 轮无新数据）", "DEBUG", self.interval, len(due), self.misses)
+        return self.interval
+
+
+poll_scheduler = PollScheduler()
 
 
 def create_progress_bar(progress: float, width: int) -> str:
@@ -1348,10 +3271,7 @@ def create_progress_bar(progress: float, width: int) -> str:
     return bar
 
 
-async def display_stats(user_data: Dict, validation_status: str = None, update_only: bool = False, config: Dict = None, account_index: int = 0, total_accounts: int = 1, price_data: Dict = None):
-   
-    global last_display_lines
-    
+def build_stats_frame(user_data: Dict, validation_status: str = None, config: Dict = None, account_index: int = 0, total_accounts: int = 1, price_data: Dict = None) -> Tuple[List[str], Set[int]]:
    
     if not user_data:
         user_data = {
@@ -1469,14 +3389,7 @@ async def display_stats(user_data: Dict, validation_status: str = None, update_o
     if price_data:
        
         if isinstance(price_data, dict) and "BTCUSD" in price_data:
-            btc_price = price_data["BTCUSD"].get("price", "")
-            if btc_price:
-                try:
-                    
-                    price_value = float(btc_price)
-                    price_info = f"{CYAN}💰 BTC: ${price_value:.2f}{RESET}"
-                except:
-                    price_info = f"{CYAN}💰 BTC: {btc_price}{RESET}"
+            price_info = f"{CYAN}💰 BTC: ${price_data['BTCUSD'].price:.2f}{RESET}"
     
    
     total_lines = 12 + (2 if status_text else 0) + (2 if config else 0)
@@ -1488,6 +3401,7 @@ async def display_stats(user_data: Dict, validation_status: str = None, update_o
     output.append(f"{CYAN}┌{'═' * width}┐{RESET}")
     output.append(f"{CYAN}│{RESET}{center_text(title, width)}{CYAN}│{RESET}")
     output.append(f"{CYAN}│{RESET}{center_text(time_info, width)}{CYAN}│{RESET}")
+    ticker_rows = {len(output) - 1}
     
   
     output.append(f"{CYAN}├{'─' * width}┤{RESET}")
@@ -1523,9 +3437,9 @@ async def display_stats(user_data: Dict, validation_status: str = None, update_o
     
     
     if config:
-        interval = config.get('stork', {}).get('intervalSeconds', 300)
+        interval = poll_scheduler.interval or config.get('stork', {}).get('intervalSeconds', 300)
         elapsed = int(time.time() - start_time)
-        remaining = max(0, interval - elapsed)
+        remaining = max(0, int(interval - elapsed))
         progress = 1 - (remaining / interval)
         
         
@@ -1542,22 +3456,128 @@ async def display_stats(user_data: Dict, validation_status: str = None, update_o
         
         output.append(f"{CYAN}├{'─' * width}┤{RESET}")
         output.append(f"{CYAN}│{RESET}{center_text(f'{YELLOW}⏳ {remaining}秒 {progress_color}{progress_bar}{RESET} {progress_percent}%', width)}{CYAN}│{RESET}")
+        ticker_rows.add(len(output) - 1)
     
     output.append(f"{CYAN}└{'═' * width}┘{RESET}")
     
+    return output, ticker_rows
+
+
+class TerminalRenderer:
+    
+    
+    def __init__(self, max_fps: float = 2, ticker_interval: float = 5):
+        self.min_frame_interval = 1 / max_fps if max_fps > 0 else 0
+        self.ticker_interval = ticker_interval
+        self.previous: List[str] = []
+        self.last_draw = 0.0
+        self.last_ticker_draw = 0.0
+    
+    def render(self, lines: List[str], ticker_rows: Set[int] = frozenset(), force: bool = False) -> bool:
+        
+        now = time.monotonic()
+        if not force and now - self.last_draw < self.min_frame_interval:
+            return False
+        
+        changed = [row for row, line in enumerate(lines) if row >= len(self.previous) or self.previous[row] != line]
+        shrunk = len(lines) < len(self.previous)
+        if not changed and not shrunk:
+            return False
+        
+        only_ticker = not shrunk and all(row in ticker_rows for row in changed)
+        if only_ticker and not force and now - self.last_ticker_draw < self.ticker_interval:
+            return False
+        
+        parts = []
+        if not self.previous:
+            parts.append('\x1b[2J')
+        for row in changed:
+            parts.append(f"\x1b[{row + 1};1H{lines[row]}\x1b[K")
+        if shrunk:
+            parts.append(f"\x1b[{len(lines) + 1};1H\x1b[J")
+        parts.append(f"\x1b[{len(lines) + 1};1H")
+        
+        sys.stdout.write(''.join(parts))
+        sys.stdout.flush()
+        
+        self.previous = list(lines)
+        self.last_draw = now
+        if any(row in ticker_rows for row in changed):
+            self.last_ticker_draw = now
+        return True
+    
+    def reset(self) -> None:
+        
+        self.previous = []
+
+
+terminal_renderer: Optional[TerminalRenderer] = None
+headless_mode = False
+
+
+async def display_stats(user_data: Dict, validation_status: str = None, update_only: bool = False, config: Dict = None, account_index: int = 0, total_accounts: int = 1, price_data: Dict = None):
    
+    global terminal_renderer
+    
+    if headless_mode:
+        return
+    
+    if terminal_renderer is None:
+        display_config = (config or {}).get('display', {})
+        terminal_renderer = TerminalRenderer(
+            max_fps=display_config.get('maxFps', 2),
+            ticker_interval=display_config.get('countdownRefreshSeconds', 5)
+        )
+    
     try:
-        
-        os.system('cls' if os.name == 'nt' else 'clear')
-        print("\n".join(output), flush=True)
+        output, ticker_rows = build_stats_frame(user_data, validation_status, config, account_index, total_accounts, price_data)
+        terminal_renderer.render(output, ticker_rows, force=not update_only)
     except Exception as e:
-       
-        os.system('cls' if os.name == 'nt' else 'clear')
-        print("\n".join(output), flush=True)
-        log(f"显示更新时出错: {str(e)}", "ERROR")
+        terminal_renderer.reset()
+        log("显示更新时出错: %s", "ERROR", str(e))
+
+
+def resolve_headless(config: Dict, headless: Optional[bool] = None) -> bool:
     
-   
-    last_display_lines = len(output)
+    if headless is not None:
+        return headless
+    
+    mode = config.get('display', {}).get('mode', 'auto')
+    if mode == 'headless':
+        return True
+    if mode == 'tui':
+        return False
+    return not sys.stdout.isatty()
+
+
+def emit_status(event: str, config: Dict, **fields) -> None:
+    
+    stats = (user_data or {}).get('stats', {})
+    status = {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'event': event,
+        'uptime': int(time.time() - process_start_time),
+        'username': (user_data or {}).get('username'),
+        'validCount': stats.get('valid', stats.get('stork_signed_prices_valid_count', 0)),
+        'invalidCount': stats.get('invalid', stats.get('stork_signed_prices_invalid_count', 0)),
+        'validationStatus': validation_status
+    }
+    status.update(fields)
+    line = json.dumps(status, ensure_ascii=False)
+    
+    status_file = config.get('display', {}).get('statusFile', '')
+    if status_file:
+        try:
+            tmp_path = f"{status_file}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(line + '\n')
+            os.replace(tmp_path, status_file)
+        except Exception as e:
+            log("写入状态文件失败: %s", "ERROR", str(e))
+    else:
+        sys.stdout.write(line + '\n')
+        sys.stdout.flush()
+
 
 async def update_progress():
   
@@ -1574,9 +3594,9 @@ async def update_progress():
                 if current_time - last_update_time >= 1:
                    
                     if current_config and 'stork' in current_config:
-                        interval = current_config.get('stork', {}).get('intervalSeconds', 300)
+                        interval = poll_scheduler.interval or current_config.get('stork', {}).get('intervalSeconds', 300)
                         elapsed = int(current_time - start_time)
-                        remaining = max(0, interval - elapsed)
+                        remaining = max(0, int(interval - elapsed))
                         
                        
                         if user_data:
@@ -1591,19 +3611,19 @@ async def update_progress():
                                     price_data=price_data
                                 )
                             except Exception as e:
-                                log(f"更新显示时出错: {str(e)}", "ERROR")
+                                log("更新显示时出错: %s", "ERROR", str(e))
                     
                     last_update_time = current_time
                 
              
                 await asyncio.sleep(1)
             except Exception as e:
-                log(f"进度更新循环中出错: {str(e)}", "ERROR")
+                log("进度更新循环中出错: %s", "ERROR", str(e))
                 await asyncio.sleep(1)
     except asyncio.CancelledError:
         pass
     except Exception as e:
-        log(f"进度更新任务出错: {str(e)}", "ERROR")
+        log("进度更新任务出错: %s", "ERROR", str(e))
 
 
 async def run_validation_process(token_manager: TokenManager, config: Dict, account_index: int) -> bool:
@@ -1612,193 +3632,214 @@ async def run_validation_process(token_manager: TokenManager, config: Dict, acco
     
     try:
         
-        stork_api = StorkAPI(config)
+        available_proxies = load_proxies()
+        stork_api = StorkAPI(config, available_proxies)
         
      
-        access_token = await token_manager.get_valid_token()
+        with tracer.span('get_valid_token'):
+            access_token = await token_manager.get_valid_token()
         if not access_token:
-            log(f"无法获取有效token，跳过验证流程", "ERROR")
+            log("无法获取有效token，跳过验证流程", "ERROR")
             validation_status = "❌ 无法获取有效token"
             return False
             
         tokens = {
             "accessToken": access_token,
-            "idToken": token_manager.id_token
+            "idToken": token_manager.id_token,
+            "username": token_manager.username
         }
         
        
-        try:
-            log("获取价格数据...", "INFO")
-            prices = await stork_api.get_signed_prices(tokens)
+        if config.get('pipeline', {}).get('enabled', True):
+            log("以流水线方式获取、校验并提交价格...", "INFO")
+            validation_status = "📥 正在流式获取并提交价格..."
+            pipeline = ValidationPipeline(config, stork_api, tokens, token_manager.username, available_proxies)
+            validation_results = await pipeline.run()
+            if not stork_api.prices_not_modified:
+                price_data = pipeline.display_prices
+            stream_error = pipeline.error
             
-          
-            processed_prices = {}
-            if isinstance(prices, list):
-               
-                for price_item in prices:
-                    if isinstance(price_item, dict) and 'asset' in price_item and 'price' in price_item:
-                        asset_key = price_item['asset']
-                        processed_prices[asset_key] = price_item
-            elif isinstance(prices, dict):
-                processed_prices = prices
+            if pipeline.skipped:
+                log("跳过 %s 个已提交过的msg_hash", "INFO", pipeline.skipped)
+            if stream_error is not None and not validation_results:
+                validation_status = f"❌ 获取价格数据失败: {str(stream_error) or type(stream_error).__name__}"
+                return False
+        else:
+            stream_error = None
+            try:
+                log("获取价格数据...", "INFO")
+                with tracer.span('get_signed_prices') as span:
+                    prices = await stork_api.get_signed_prices(tokens)
+                    span.attrs['assets'] = len(prices)
                 
-            price_data = processed_prices
-            log(f"获取到价格数据: {price_data}")
-            validation_status = "✅ 成功获取价格数据"
-        except Exception as e:
-            log(f"获取价格数据失败: {str(e)}", "ERROR")
-            validation_status = f"❌ 获取价格数据失败: {str(e)}"
-            return False
-        
-       
-        try:
+              
+                price_data = {price.asset: price for price in prices if price.asset in DISPLAY_ASSETS}
+                poll_scheduler.observe(prices)
+                log("获取到价格数据: %s", "DEBUG", price_data)
+                validation_status = "✅ 成功获取价格数据"
+            except Exception as e:
+                log("获取价格数据失败: %s", "ERROR", str(e))
+                validation_status = f"❌ 获取价格数据失败: {str(e)}"
+                return False
+            
            
             to_validate = []
-            for asset, data in processed_prices.items():
+            skipped = 0
+            for price, is_valid in zip(prices, await judge_prices(prices)):
                 
-                data_copy = data.copy()
-                if 'asset' not in data_copy:
-                    data_copy['asset'] = asset 
-                to_validate.append(data_copy)
+                if validated_hashes.contains(token_manager.username, price.msg_hash_hex):
+                    skipped += 1
+                    continue
+                to_validate.append((price, is_valid))
             
-            if not to_validate:
-                log("没有待验证的价格", "INFO")
-                validation_status = "✅ 没有待验证的价格"
-                return True
+            if skipped:
+                log("跳过 %s 个已提交过的msg_hash", "INFO", skipped)
             
-           
-            log(f"找到 {len(to_validate)} 个价格待验证", "INFO")
+            log("找到 %s 个价格待验证", "INFO", len(to_validate))
             validation_status = f"📥 找到 {len(to_validate)} 个价格待验证"
             
-         
-            available_proxies = load_proxies()
-            
           
-            validation_tasks = []
-            for price_data_item in to_validate:
+            workers = []
+            for price, is_valid in to_validate:
                
                 proxy = None
                 if available_proxies:
                     proxy = random.choice(available_proxies)
                 
               
-                worker = ValidationWorker(price_data_item, tokens, proxy, config)
-                validation_tasks.append(worker.validate_and_send())
+                workers.append(ValidationWorker(price, is_valid, tokens, proxy, config, stork_api))
             
            
-            validation_results = await asyncio.gather(*validation_tasks)
+            validation_results = await ValidationDispatcher(config).dispatch(workers)
+        
+        try:
+            if not validation_results:
+                log("没有待验证的价格", "INFO")
+                validation_status = "✅ 没有待验证的价格"
+                return True
+            
+            for result in validation_results:
+                if result.get('success', False):
+                    validated_hashes.add(token_manager.username, result['msg_hash'])
+            validated_hashes.flush()
             
            
             valid_count = sum(1 for result in validation_results if result.get('success', False) and result.get('is_valid', False))
             invalid_count = sum(1 for result in validation_results if result.get('success', False) and not result.get('is_valid', False))
-            error_count = sum(1 for result in validation_results if not result.get('success', False))
+            expired_count = sum(1 for result in validation_results if result.get('expired', False))
+            error_count = sum(1 for result in validation_results if not result.get('success', False)) - expired_count
+            VALIDATIONS_TOTAL.inc('valid', amount=valid_count)
+            VALIDATIONS_TOTAL.inc('invalid', amount=invalid_count)
+            VALIDATIONS_TOTAL.inc('error', amount=error_count)
+            VALIDATIONS_TOTAL.inc('expired', amount=expired_count)
             
-            validation_status = f"✅ 验证完成! 有效: {valid_count}, 无效: {invalid_count}, 错误: {error_count}"
-            log(f"验证结果: {validation_status}")
+            summary = f"有效: {valid_count}, 无效: {invalid_count}, 错误: {error_count}"
+            if expired_count:
+                summary += f", 过期取消: {expired_count}"
+            if stream_error is not None:
+                validation_status = f"⚠️ 价格流中断（{str(stream_error) or type(stream_error).__name__}），仅完成部分验证! {summary}"
+                log("验证结果: %s", "WARN", validation_status)
+                return False
+            validation_status = f"✅ 验证完成! {summary}"
+            log("验证结果: %s", "INFO", validation_status)
             return True
         except Exception as e:
-            log(f"验证失败: {str(e)}", "ERROR")
+            log("验证失败: %s", "ERROR", str(e))
             validation_status = f"❌ 验证失败: {str(e)}"
             return False
             
     except Exception as e:
-        log(f"验证流程出错: {str(e)}", "ERROR")
+        log("验证流程出错: %s", "ERROR", str(e))
         validation_status = f"❌ 验证流程出错: {str(e)}"
         return False
 
 
-async def get_user_data(token_manager: TokenManager, config: Dict) -> Dict:
+async def fetch_user_data(token_manager: TokenManager, config: Dict, strict: bool = False, gate: Optional[asyncio.Event] = None) -> Dict:
    
-    try:
-        
+    with tracer.span('get_valid_token'):
         access_token = await token_manager.get_valid_token()
-        if not access_token:
-            log("无法获取有效token，无法获取用户数据", "ERROR")
-            raise Exception("无法获取有效token")
-        
-        tokens = {
-            "accessToken": access_token,
-            "idToken": token_manager.id_token
+    if not access_token:
+        log("无法获取有效token，无法获取用户数据", "ERROR")
+        raise Exception("无法获取有效token")
+    
+    tokens = {
+        "accessToken": access_token,
+        "idToken": token_manager.id_token,
+        "username": token_manager.username
+    }
+    
+   
+    user_info_from_token = extract_user_info_from_token(token_manager.id_token)
+    log("从ID token中提取的用户信息: %s", "INFO", user_info_from_token)
+    
+    
+    stork_api = StorkAPI(config)
+    
+    
+    with tracer.span('get_user_stats'):
+        user_data = await stork_api.get_user_stats(tokens, strict, gate)
+    log("从API获取到用户数据: %s", "DEBUG", user_data)
+    
+    
+    if not user_data:
+        user_data = {}
+    
+   
+    if "stats" not in user_data:
+        user_data["stats"] = {
+            "valid": 0,
+            "invalid": 0,
+            "total": 0,
+            "lastCheck": ""
         }
-        
-       
-        user_info_from_token = extract_user_info_from_token(token_manager.id_token)
-        log(f"从ID token中提取的用户信息: {user_info_from_token}", "INFO")
-        
-        
-        stork_api = StorkAPI(config)
-        
-        
-        try:
-            user_data = await stork_api.get_user_stats(tokens)
-            log(f"从API获取到用户数据: {user_data}", "INFO")
-        except Exception as e:
-            log(f"从API获取用户数据失败: {str(e)}，将使用从token中提取的信息", "WARN")
-           
-            user_data = {
-                "username": user_info_from_token.get("email", token_manager.username),
-                "email": user_info_from_token.get("email", token_manager.username),
-                "userId": user_info_from_token.get("userId", "未知"),
-                "referralCode": user_info_from_token.get("referralCode", "未知"),
-                "stats": {
-                    "valid": 0,
-                    "invalid": 0,
-                    "total": 0,
-                    "lastCheck": ""
-                }
-            }
-        
-        
-        if not user_data:
-            user_data = {}
-        
-       
-        if "stats" not in user_data:
-            user_data["stats"] = {
-                "valid": 0,
-                "invalid": 0,
-                "total": 0,
-                "lastCheck": ""
-            }
-        
-       
-        if not user_data.get("username") or user_data.get("username") == "未知":
-            user_data["username"] = user_info_from_token.get("email", token_manager.username)
-        
-        if not user_data.get("email"):
-            user_data["email"] = user_info_from_token.get("email", token_manager.username)
-        
-        
-        if not user_data.get("userId") or user_data.get("userId") == "未知":
-            user_data["userId"] = user_info_from_token.get("userId", "未知")
-        
-       
-        if not user_data.get("referralCode") or user_data.get("referralCode") == "未知":
-            user_data["referralCode"] = user_info_from_token.get("referralCode", "未知")
-        
-        
-        log(f"最终用户数据: {user_data}", "INFO")
-        
-        return user_data
-    except Exception as e:
-        log(f"获取用户数据失败: {str(e)}", "ERROR")
-        
-       
-        user_info = extract_user_info_from_token(token_manager.id_token)
-        
-        
-        return {
-            "username": user_info.get("email", token_manager.username),
-            "email": user_info.get("email", token_manager.username),
-            "userId": user_info.get("userId", "未知"),
-            "referralCode": user_info.get("referralCode", "未知"),
-            "stats": {
-                "valid": 0,
-                "invalid": 0,
-                "total": 0,
-                "lastCheck": ""
-            }
+    
+   
+    if not user_data.get("username") or user_data.get("username") == "未知":
+        user_data["username"] = user_info_from_token.get("email", token_manager.username)
+    
+    if not user_data.get("email"):
+        user_data["email"] = user_info_from_token.get("email", token_manager.username)
+    
+    
+    if not user_data.get("userId") or user_data.get("userId") == "未知":
+        user_data["userId"] = user_info_from_token.get("userId", "未知")
+    
+   
+    if not user_data.get("referralCode") or user_data.get("referralCode") == "未知":
+        user_data["referralCode"] = user_info_from_token.get("referralCode", "未知")
+    
+    
+    log("最终用户数据: %s", "DEBUG", user_data)
+    
+    return user_data
+
+
+def fallback_user_data(token_manager: TokenManager) -> Dict:
+   
+    user_info = extract_user_info_from_token(token_manager.id_token)
+    
+    
+    return {
+        "username": user_info.get("email", token_manager.username),
+        "email": user_info.get("email", token_manager.username),
+        "userId": user_info.get("userId", "未知"),
+        "referralCode": user_info.get("referralCode", "未知"),
+        "stats": {
+            "valid": 0,
+            "invalid": 0,
+            "total": 0,
+            "lastCheck": ""
         }
+    }
+
+
+async def get_user_data(token_manager: TokenManager, config: Dict) -> Dict:
+   
+    try:
+        return await fetch_user_data(token_manager, config)
+    except Exception as e:
+        log("获取用户数据失败: %s，将使用从token中提取的信息", "WARN", str(e))
+        return fallback_user_data(token_manager)
 
 
 def extract_user_info_from_token(id_token: str) -> Dict:
@@ -1815,12 +3856,12 @@ def extract_user_info_from_token(id_token: str) -> Dict:
     
     try:
         
-        log(f"尝试从ID token解析用户信息，token长度: {len(id_token)}", "DEBUG")
+        log("尝试从ID token解析用户信息，token长度: %s", "DEBUG", len(id_token))
         
        
         token_parts = id_token.split('.')
         if len(token_parts) != 3:
-            log(f"ID token格式不正确，无法解析", "WARN")
+            log("ID token格式不正确，无法解析", "WARN")
             return user_info
         
       
@@ -1834,33 +3875,131 @@ def extract_user_info_from_token(id_token: str) -> Dict:
             token_data = json.loads(decoded_payload.decode('utf-8', errors='ignore'))
             
             
-            log(f"成功解码token payload，包含字段: {list(token_data.keys())}", "DEBUG")
+            log("成功解码token payload，包含字段: %s", "DEBUG", list(token_data.keys()))
             
            
             if 'sub' in token_data:
                 user_info['userId'] = token_data['sub']
-                log(f"从ID token中提取用户ID: {user_info['userId']}", "INFO")
+                log("从ID token中提取用户ID: %s", "INFO", user_info['userId'])
             
             
             for field in ['custom:referral_code', 'referral_code', 'referralCode']:
                 if field in token_data and token_data[field]:
                     user_info['referralCode'] = token_data[field]
-                    log(f"从ID token中提取推荐码: {user_info['referralCode']}", "INFO")
+                    log("从ID token中提取推荐码: %s", "INFO", user_info['referralCode'])
                     break
             
             if 'email' in token_data:
                 user_info['email'] = token_data['email']
-                log(f"从ID token中提取邮箱: {user_info['email']}", "INFO")
+                log("从ID token中提取邮箱: %s", "INFO", user_info['email'])
                 
         except Exception as e:
-            log(f"解析token payload失败: {str(e)}", "WARN")
+            log("解析token payload失败: %s", "WARN", str(e))
             
     except Exception as e:
-        log(f"解析ID token失败: {str(e)}", "WARN")
+        log("解析ID token失败: %s", "WARN", str(e))
     
     return user_info
 
 
+class UserStatsCache:
+    
+    
+    def __init__(self):
+        self.entries: Dict[str, Tuple[float, Dict]] = {}
+        self.pending: Dict[str, Tuple[TokenManager, Dict]] = {}
+        self.ttl_seconds = 300
+        self.enabled = True
+        self.displayed: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+        self.wake_event: Optional[asyncio.Event] = None
+        self.idle: Optional[asyncio.Event] = None
+    
+    def configure(self, config: Dict) -> None:
+        
+        stats_config = config.get('userStats', {})
+        self.enabled = stats_config.get('enabled', True)
+        self.ttl_seconds = stats_config.get('ttlSeconds', 300)
+    
+    def start(self) -> None:
+        
+        if self.task is None or self.task.done():
+            self.wake_event = asyncio.Event()
+            self.idle = asyncio.Event()
+            self.idle.set()
+            self.task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+    
+    def get(self, token_manager: TokenManager, config: Dict) -> Dict:
+        
+        username = token_manager.username
+        self.displayed = username
+        entry = self.entries.get(username)
+        if entry is None or time.time() - entry[0] >= self.ttl_seconds:
+            self.pending[username] = (token_manager, config)
+            self.start()
+            self.wake_event.set()
+        
+        if entry is None:
+            log("用户 %s 的统计数据尚未缓存，先使用token中的信息", "DEBUG", username)
+            return fallback_user_data(token_manager)
+        return entry[1]
+    
+    def pause(self) -> None:
+        
+        if self.idle is not None:
+            self.idle.clear()
+    
+    def resume(self) -> None:
+        
+        if self.idle is not None:
+            self.idle.set()
+    
+    async def _refresh(self, username: str, token_manager: TokenManager, config: Dict) -> None:
+        
+        global user_data
+        
+        tracer.start_trace()
+        try:
+            data = await fetch_user_data(token_manager, config, strict=True, gate=self.idle)
+        except Exception as e:
+            log("后台刷新用户 %s 的统计数据失败，继续使用旧数据: %s", "WARN", username, str(e))
+            return
+        
+        self.entries[username] = (time.time(), data)
+        if self.displayed == username:
+            user_data = data
+    
+    async def _run(self) -> None:
+        
+        while True:
+            try:
+                await self.wake_event.wait()
+                self.wake_event.clear()
+                while self.pending:
+                    await self.idle.wait()
+                    username = next(iter(self.pending))
+                    token_manager, config = self.pending.pop(username)
+                    await self._refresh(username, token_manager, config)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log("用户统计刷新任务出错: %s", "ERROR", str(e))
+                await asyncio.sleep(60)
+
+
+user_stats_cache = UserStatsCache()
+
+
 async def process_account(account_index: int, config: Dict) -> bool:
    
     global user_data, validation_status, price_data
@@ -1868,17 +4007,20 @@ async def process_account(account_index: int, config: Dict) -> bool:
     try:
        
         account = accounts[account_index]
-        log(f"处理账户 {account_index + 1}/{len(accounts)}: {account.get('email', account.get('username', 'unknown'))}")
+        log("处理账户 %s/%s: %s", "INFO", account_index + 1, len(accounts), account.get('email', account.get('username', 'unknown')))
         
         
-        token_manager = TokenManager(account, config)
+        token_manager = get_token_manager(account, config)
         
         
         try:
-            user_data = await get_user_data(token_manager, config)
-            log(f"获取到用户数据: {user_data}")
+            if user_stats_cache.enabled:
+                user_data = user_stats_cache.get(token_manager, config)
+            else:
+                user_data = await get_user_data(token_manager, config)
+            log("获取到用户数据: %s", "DEBUG", user_data)
         except Exception as e:
-            log(f"获取用户数据失败: {str(e)}", "ERROR")
+            log("获取用户数据失败: %s", "ERROR", str(e))
             user_data = {
                 "username": account.get("email", account.get("username", "未知")),
                 "userId": "未知",
@@ -1903,21 +4045,35 @@ async def process_account(account_index: int, config: Dict) -> bool:
         )
     
        
-        success = await run_validation_process(token_manager, config, account_index)
+        user_stats_cache.pause()
+        try:
+            success = await run_validation_process(token_manager, config, account_index)
+        finally:
+            user_stats_cache.resume()
         return success
         
     except Exception as e:
-        log(f"处理账户时出错: {str(e)}", "ERROR")
+        log("处理账户时出错: %s", "ERROR", str(e))
         return False
 
 
-async def main():
+async def main(headless: Optional[bool] = None):
     
-    global accounts, current_config, start_time, user_data, validation_status, price_data
+    global accounts, current_config, start_time, user_data, validation_status, price_data, headless_mode
     
     try:
        
         current_config = load_config()
+        configure_logging(current_config)
+        tracer.configure(current_config)
+        fixture_recorder.configure(current_config)
+        signature_verifier.configure(current_config)
+        price_history.configure(current_config)
+        poll_scheduler.configure(current_config)
+        response_cache.configure(current_config)
+        validated_hashes.configure(current_config)
+        user_stats_cache.configure(current_config)
+        headless_mode = resolve_headless(current_config, headless)
         if not validate_config():
             log("配置验证失败，请检查config.json", "ERROR")
             return
@@ -1935,7 +4091,7 @@ async def main():
            
             try:
                 accounts = []
-                tokens_data = get_tokens()
+                tokens_data = token_store.load()
                 for username, token_info in tokens_data.items():
                     accounts.append({
                         "email": username,
@@ -1943,14 +4099,19 @@ async def main():
                         "tokens": token_info
                     })
                 if accounts:
-                    log(f"从tokens.json加载了 {len(accounts)} 个账户", "INFO")
+                    log("从tokens.json加载了 %s 个账户", "INFO", len(accounts))
                 else:
                     log("没有找到账户，请检查tokens.json或创建accounts.py", "ERROR")
                     return
             except Exception as e:
-                log(f"加载账户失败: {str(e)}", "ERROR")
+                log("加载账户失败: %s", "ERROR", str(e))
                 return
         
+        
+        hydrate_token_managers(accounts, current_config)
+        token_refresh_scheduler.start()
+        metrics_server = await start_metrics_server(current_config)
+        
        
         log("🚀 启动 Stork Oracle Auto Bot 🚀", "INFO")
         
@@ -1958,7 +4119,12 @@ async def main():
         start_time = time.time()
         
       
-        progress_task = asyncio.create_task(update_progress())
+        progress_task = None
+        if headless_mode:
+            log("以无界面模式运行，状态以JSON行输出", "INFO")
+            emit_status("start", current_config, accounts=len(accounts))
+        else:
+            progress_task = asyncio.create_task(update_progress())
         
         backoff_time = 5 
         max_backoff = 3600  
@@ -1970,17 +4136,23 @@ async def main():
                     start_time = time.time()
                     log("重置计时器，开始新一轮验证", "INFO")
                     
+                    round_started = time.monotonic()
                   
                     for account_index in range(len(accounts)):
-                        log(f"开始处理账户 {account_index + 1}/{len(accounts)}")
-                        success = await process_account(account_index, current_config)
+                        log("开始处理账户 %s/%s", "INFO", account_index + 1, len(accounts))
+                        tracer.start_trace()
+                        with tracer.span('round', account=account_index + 1) as span:
+                            success = await process_account(account_index, current_config)
+                            span.status = 'ok' if success else 'failed'
+                        if headless_mode:
+                            emit_status("account", current_config, account=account_index + 1, success=success)
                         
                         if success:
                            
                             backoff_time = 5
                         else:
                           
-                            log(f"等待 {backoff_time} 秒后重试...", "WARN")
+                            log("等待 %s 秒后重试...", "WARN", backoff_time)
                             await asyncio.sleep(backoff_time)
                             
                             backoff_time = min(backoff_time * 2, max_backoff)
@@ -1990,28 +4162,47 @@ async def main():
                             await asyncio.sleep(10)
                     
                    
+                    ROUND_DURATION.observe(time.monotonic() - round_started)
                     start_time = time.time()
-                    interval = current_config['stork']['intervalSeconds'] + random.randint(-30, 30)
-                    log(f"所有账户处理完毕，等待 {interval} 秒后重新开始...", "INFO")
+                    interval = poll_scheduler.next_interval()
+                    log("所有账户处理完毕，等待 %s 秒后重新开始...", "INFO", interval)
                     validation_status = f"✅ 所有账户处理完毕，等待 {interval} 秒后重新开始..."
+                    if headless_mode:
+                        emit_status("round", current_config, nextRoundIn=interval)
                     await asyncio.sleep(interval)
                     
                 except KeyboardInterrupt:
                     log("程序被用户停止", "INFO")
                     break
                 except Exception as e:
-                    log(f"意外错误: {str(e)}", "ERROR")
+                    log("意外错误: %s", "ERROR", str(e))
                     await asyncio.sleep(60)
         finally:
-            progress_task.cancel()
+            if progress_task is not None:
+                progress_task.cancel()
+            await token_refresh_scheduler.stop()
+            await user_stats_cache.stop()
+            await stop_metrics_server(metrics_server)
+            signature_verifier.close()
+            price_history.close()
+            token_store.flush()
+            await close_http_session()
             
     except Exception as e:
-        log(f"主程序错误: {str(e)}", "ERROR")
+        log("主程序错误: %s", "ERROR", str(e))
         logger.error(f"主程序错误: {str(e)}")
        
         await asyncio.sleep(60)
-        await main()
+        await main(headless)
+
+
+def parse_args() -> argparse.Namespace:
+    
+    parser = argparse.ArgumentParser(description="Stork Oracle Auto Bot")
+    parser.add_argument('--headless', action='store_true', default=None, help="不显示终端界面，以JSON行输出状态")
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    args = parse_args()
+    asyncio.run(main(headless=args.headless))
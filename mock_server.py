@@ -0,0 +1,271 @@
+import os
+import sys
+import json
+import time
+import random
+import base64
+import asyncio
+import argparse
+from typing import Dict, Optional
+from aiohttp import web
+import stork_crypto
+
+
+def _b64url(data: bytes) -> str:
+
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def make_jwt(claims: Dict) -> str:
+
+    header = _b64url(json.dumps({'alg': 'none', 'typ': 'JWT'}).encode('utf-8'))
+    payload = _b64url(json.dumps(claims).encode('utf-8'))
+    return f"{header}.{payload}.{_b64url(os.urandom(16))}"
+
+
+class StandInServer:
+
+
+    def __init__(self, assets: int = 20, latency: float = 0.0, rate_429: float = 0.0, rate_5xx: float = 0.0,
+                 update_interval: float = 0.0, token_lifetime: int = 3600, host: str = '127.0.0.1', port: int = 0,
+                 publisher_key: Optional[int] = None):
+        self.assets = [f"ASSET{i:05d}USD" for i in range(assets)]
+        self.assets[:1] = ['BTCUSD'] if assets else []
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.update_interval = update_interval
+        self.token_lifetime = token_lifetime
+        self.publisher_key = publisher_key
+        self.publisher = stork_crypto.private_key_to_address(publisher_key) if publisher_key else None
+        self.host = host
+        self.port = port
+        self.runner: Optional[web.AppRunner] = None
+        self.prices = {asset: random.randint(1, 100000) * 10**18 for asset in self.assets}
+        self.snapshot: Dict = {}
+        self.snapshot_body = b''
+        self.snapshot_at = 0.0
+        self.snapshot_version = 0
+        self.last_accepted_at = time.time()
+        self.stats = {'prices': 0, 'validations': 0, 'me': 0, 'cognito': 0, 'accepted': 0, '304': 0, '429': 0, '5xx': 0}
+
+    @property
+    def base_url(self) -> str:
+
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def cognito_endpoint(self) -> str:
+
+        return f"{self.base_url}/cognito/"
+
+    async def _simulate(self, endpoint: str, inject_errors: bool = True) -> Optional[web.Response]:
+
+        self.stats[endpoint] += 1
+        if self.latency > 0:
+            await asyncio.sleep(random.uniform(0.5, 1.5) * self.latency)
+        if not inject_errors:
+            return None
+
+        roll = random.random()
+        if roll < self.rate_429:
+            self.stats['429'] += 1
+            return web.json_response({'error': 'rate limited'}, status=429, headers={'Retry-After': '1'})
+        if roll < self.rate_429 + self.rate_5xx:
+            self.stats['5xx'] += 1
+            return web.json_response({'error': 'internal'}, status=503)
+        return None
+
+    def _conditional(self, request: web.Request, body: bytes, etag: str) -> web.Response:
+
+        if request.headers.get('If-None-Match') == etag:
+            self.stats['304'] += 1
+            return web.Response(status=304, headers={'ETag': etag})
+        response = web.Response(body=body, content_type='application/json', headers={'ETag': etag})
+        response.enable_compression()
+        return response
+
+    def build_snapshot(self) -> Dict:
+
+        now_ns = time.time_ns()
+        data = {}
+        for asset in self.assets:
+            self.prices[asset] = max(1, int(self.prices[asset] * random.uniform(0.999, 1.001)))
+            if self.publisher_key:
+                msg_hash = stork_crypto.stork_message_hash(self.publisher, asset, now_ns, self.prices[asset])
+                signature = stork_crypto.sign_msg_hash(msg_hash, self.publisher_key)
+            else:
+                msg_hash = os.urandom(32)
+                signature = {'r': '0x' + os.urandom(32).hex(), 's': '0x' + os.urandom(32).hex(), 'v': '0x1b'}
+            data[asset] = {
+                'price': str(self.prices[asset]),
+                'asset_id': asset,
+                'timestamped_signature': {
+                    'signature': signature,
+                    'timestamp': now_ns,
+                    'msg_hash': '0x' + msg_hash.hex()
+                }
+            }
+        return {'data': data}
+
+    async def handle_prices(self, request: web.Request) -> web.Response:
+
+        error = await self._simulate('prices')
+        if error is not None:
+            return error
+
+        if not self.snapshot or time.time() - self.snapshot_at >= self.update_interval:
+            self.snapshot = self.build_snapshot()
+            self.snapshot_body = json.dumps(self.snapshot).encode('utf-8')
+            self.snapshot_at = time.time()
+            self.snapshot_version += 1
+        return self._conditional(request, self.snapshot_body, f'"prices-{self.snapshot_version}"')
+
+    async def handle_validation(self, request: web.Request) -> web.Response:
+
+        error = await self._simulate('validations')
+        if error is not None:
+            return error
+
+        body = await request.json()
+        self.stats['accepted'] += 1
+        self.last_accepted_at = time.time()
+        if 'msg_hash' not in body or 'valid' not in body:
+            return web.json_response({'error': 'bad request'}, status=400)
+        return web.json_response({'message': 'ok'})
+
+    async def handle_me(self, request: web.Request) -> web.Response:
+
+        error = await self._simulate('me')
+        if error is not None:
+            return error
+
+        body = json.dumps({'data': {
+            'id': 'standin-user',
+            'email': 'bench@example.com',
+            'referral_code': 'BENCH',
+            'stats': {
+                'stork_signed_prices_valid_count': self.stats['accepted'],
+                'stork_signed_prices_invalid_count': 0,
+                'stork_signed_prices_last_verified_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.last_accepted_at)),
+                'referral_usage_count': 0
+            }
+        }}).encode('utf-8')
+        return self._conditional(request, body, f'"me-{self.stats["accepted"]}"')
+
+    def _auth_result(self, username: str, refresh_token: Optional[str] = None) -> Dict:
+
+        now = int(time.time())
+        claims = {'sub': 'standin-user', 'email': username, 'exp': now + self.token_lifetime, 'iat': now}
+        result = {
+            'AccessToken': make_jwt(claims),
+            'IdToken': make_jwt(dict(claims, **{'custom:referral_code': 'BENCH'})),
+            'ExpiresIn': self.token_lifetime,
+            'TokenType': 'Bearer'
+        }
+        if refresh_token is None:
+            result['RefreshToken'] = _b64url(os.urandom(32))
+        return {'AuthenticationResult': result}
+
+    async def handle_cognito(self, request: web.Request) -> web.Response:
+
+        await self._simulate('cognito', inject_errors=False)
+
+        action = request.headers.get('X-Amz-Target', '').split('.')[-1]
+        body = json.loads(await request.read())
+
+        if action == 'InitiateAuth' and body.get('AuthFlow') == 'REFRESH_TOKEN_AUTH':
+            return web.json_response(self._auth_result('bench@example.com', body['AuthParameters']['REFRESH_TOKEN']))
+
+        if action == 'InitiateAuth' and body.get('AuthFlow') == 'USER_SRP_AUTH':
+            username = body['AuthParameters']['USERNAME']
+            return web.json_response({
+                'ChallengeName': 'PASSWORD_VERIFIER',
+                'ChallengeParameters': {
+                    'USER_ID_FOR_SRP': username,
+                    'SRP_B': os.urandom(384).hex(),
+                    'SALT': os.urandom(16).hex(),
+                    'SECRET_BLOCK': base64.b64encode(os.urandom(64)).decode('ascii')
+                }
+            })
+
+        if action == 'RespondToAuthChallenge':
+            return web.json_response(self._auth_result(body['ChallengeResponses']['USERNAME']))
+
+        return web.json_response({'__type': 'InvalidParameterException', 'message': f"unsupported {action}"}, status=400)
+
+    async def start(self) -> 'StandInServer':
+
+        app = web.Application()
+        app.router.add_get('/v1/stork_signed_prices', self.handle_prices)
+        app.router.add_post('/v1/stork_signed_prices/validations', self.handle_validation)
+        app.router.add_get('/v1/me', self.handle_me)
+        app.router.add_post('/cognito/', self.handle_cognito)
+
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+def add_server_arguments(parser: argparse.ArgumentParser) -> None:
+
+    parser.add_argument('--assets', type=int, default=20, help="每次返回的资产数量")
+    parser.add_argument('--latency', type=float, default=0.0, help="平均响应延迟（秒）")
+    parser.add_argument('--rate-429', type=float, default=0.0, help="返回429的比例")
+    parser.add_argument('--rate-5xx', type=float, default=0.0, help="返回5xx的比例")
+    parser.add_argument('--update-interval', type=float, default=0.0, help="价格快照更新间隔（秒），0表示每次请求都更新")
+    parser.add_argument('--publisher-key', default=None, help="用该secp256k1私钥（十六进制）为价格签名，默认使用随机签名")
+
+
+def server_from_args(args: argparse.Namespace, host: str = '127.0.0.1', port: int = 0) -> StandInServer:
+
+    return StandInServer(
+        assets=args.assets,
+        latency=args.latency,
+        rate_429=args.rate_429,
+        rate_5xx=args.rate_5xx,
+        update_interval=args.update_interval,
+        host=host,
+        port=port,
+        publisher_key=int(args.publisher_key, 16) if args.publisher_key else None
+    )
+
+
+async def serve_forever(server: StandInServer) -> None:
+
+    await server.start()
+    print(f"Stork API 本地替身已启动: {server.base_url}")
+    print(f"config.json 中设置 \"api_url\": \"{server.base_url}\"，\"cognito\": {{\"endpoint\": \"{server.cognito_endpoint}\"}}")
+    try:
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        await server.stop()
+
+
+def main() -> int:
+
+    parser = argparse.ArgumentParser(description="本地 Stork API + Cognito 替身服务")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8787)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve_forever(server_from_args(args, args.host, args.port)))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import coincurve
+except ImportError:
+    coincurve = None
+
+try:
+    from Crypto.Hash import keccak as _keccak
+except ImportError:
+    _keccak = None
+
+
+SECP256K1_N = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+ETH_SIGNED_MESSAGE_PREFIX = b'\x19Ethereum Signed Message:\n32'
+TIMESTAMP_DIVISORS = {'seconds': 1000000000, 'milliseconds': 1000000, 'nanoseconds': 1}
+
+
+def available() -> bool:
+
+    return coincurve is not None and _keccak is not None
+
+
+def keccak256(data: bytes) -> bytes:
+
+    return _keccak.new(digest_bits=256, data=data).digest()
+
+
+def public_key_to_address(public_key: 'coincurve.PublicKey') -> str:
+
+    return '0x' + keccak256(public_key.format(compressed=False)[1:])[-20:].hex()
+
+
+def private_key_to_address(private_key: int) -> str:
+
+    return public_key_to_address(coincurve.PrivateKey(private_key.to_bytes(32, 'big')).public_key)
+
+
+def stork_message_hash(publisher: str, asset_id: str, timestamp_ns: int, raw_price: int, timestamp_unit: str = 'seconds') -> bytes:
+
+    publisher_bytes = bytes.fromhex(publisher[2:] if publisher.startswith('0x') else publisher)
+    timestamp = timestamp_ns // TIMESTAMP_DIVISORS[timestamp_unit]
+    return keccak256(
+        publisher_bytes
+        + asset_id.encode('utf-8')
+        + timestamp.to_bytes(32, 'big')
+        + raw_price.to_bytes(32, 'big', signed=True)
+    )
+
+
+def decode_signature(signature: Any) -> Optional[Tuple[int, int, int]]:
+
+    try:
+        if isinstance(signature, dict):
+            r, s, v = (int(value, 16) if isinstance(value, str) else int(value) for value in (signature['r'], signature['s'], signature['v']))
+        else:
+            raw = bytes.fromhex(signature[2:] if signature.startswith('0x') else signature)
+            if len(raw) != 65:
+                return None
+            r, s, v = int.from_bytes(raw[:32], 'big'), int.from_bytes(raw[32:64], 'big'), raw[64]
+    except (KeyError, ValueError, TypeError, AttributeError):
+        return None
+    return r, s, v - 27 if v >= 27 else v
+
+
+def recover_signer(msg_hash: bytes, signature: Any, prefixed: bool = True) -> Optional[str]:
+
+    decoded = decode_signature(signature)
+    if decoded is None:
+        return None
+    r, s, recovery_id = decoded
+    if not (0 < r < SECP256K1_N and 0 < s < SECP256K1_N) or recovery_id not in (0, 1):
+        return None
+
+    digest = keccak256(ETH_SIGNED_MESSAGE_PREFIX + msg_hash) if prefixed else msg_hash
+    try:
+        public_key = coincurve.PublicKey.from_signature_and_message(
+            r.to_bytes(32, 'big') + s.to_bytes(32, 'big') + bytes([recovery_id]), digest, hasher=None
+        )
+    except Exception:
+        return None
+    return public_key_to_address(public_key)
+
+
+def recover_signers(items: List[Tuple[bytes, Any]], prefixed: bool = True) -> List[Optional[str]]:
+
+    return [recover_signer(msg_hash, signature, prefixed) for msg_hash, signature in items]
+
+
+def sign_msg_hash(msg_hash: bytes, private_key: int, prefixed: bool = True) -> Dict:
+
+    digest = keccak256(ETH_SIGNED_MESSAGE_PREFIX + msg_hash) if prefixed else msg_hash
+    raw = coincurve.PrivateKey(private_key.to_bytes(32, 'big')).sign_recoverable(digest, hasher=None)
+    return {'r': '0x' + raw[:32].hex(), 's': '0x' + raw[32:64].hex(), 'v': hex(27 + raw[64])}
@@ -0,0 +1,94 @@
+import os
+import sys
+import json
+import glob
+import math
+import argparse
+from typing import Dict, List
+
+
+TRACE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stork_trace.jsonl')
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def load_spans(path: str) -> List[Dict]:
+
+    spans = []
+    for file_path in sorted(glob.glob(f"{path}*"), reverse=True):
+        if not (file_path == path or file_path[len(path):].lstrip('.').isdigit()):
+            continue
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    spans.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    return spans
+
+
+def summarize(spans: List[Dict]) -> Dict[str, Dict]:
+
+    groups: Dict[str, Dict] = {}
+    for span in spans:
+        key = span.get('span', '?')
+        if span.get('endpoint'):
+            key = f"{key}:{span['endpoint']}"
+
+        group = groups.setdefault(key, {'durations': [], 'errors': 0, 'retries': 0})
+        group['durations'].append(float(span.get('duration', 0)))
+        group['retries'] += int(span.get('retries', 0))
+
+        status = span.get('status')
+        if status not in ('ok', 'failed', 'expired') and not (isinstance(status, int) and status < 400):
+            group['errors'] += 1
+
+    summary = {}
+    for key, group in groups.items():
+        durations = sorted(group['durations'])
+        summary[key] = {
+            'count': len(durations),
+            'p50': percentile(durations, 0.50),
+            'p95': percentile(durations, 0.95),
+            'p99': percentile(durations, 0.99),
+            'max': durations[-1],
+            'errors': group['errors'],
+            'retries': group['retries']
+        }
+    return summary
+
+
+def main() -> int:
+
+    parser = argparse.ArgumentParser(description="汇总 stork_trace.jsonl 中各阶段的耗时分位数")
+    parser.add_argument('path', nargs='?', default=TRACE_PATH, help="追踪文件路径（自动包含轮转文件）")
+    parser.add_argument('--json', action='store_true', help="以JSON输出")
+    args = parser.parse_args()
+
+    spans = load_spans(args.path)
+    if not spans:
+        print(f"没有找到追踪数据: {args.path}", file=sys.stderr)
+        return 1
+
+    summary = summarize(spans)
+    if args.json:
+        print(json.dumps(summary, indent=2, ensure_ascii=False))
+        return 0
+
+    rounds = len({span.get('trace') for span in spans if span.get('trace')})
+    print(f"共 {len(spans)} 个span，{rounds} 轮")
+    print(f"{'阶段':<28}{'次数':>8}{'p50(ms)':>11}{'p95(ms)':>11}{'p99(ms)':>11}{'max(ms)':>11}{'错误':>7}{'重试':>7}")
+    for key, row in sorted(summary.items(), key=lambda item: -item[1]['p95']):
+        print(f"{key:<28}{row['count']:>8}{row['p50'] * 1000:>11.1f}{row['p95'] * 1000:>11.1f}"
+              f"{row['p99'] * 1000:>11.1f}{row['max'] * 1000:>11.1f}{row['errors']:>7}{row['retries']:>7}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())